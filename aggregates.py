@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+# Предагрегированный куб (страна × жанр) для страницы 1.
+# Любая выборка стран собирается из небольших частичных агрегатов,
+# поэтому стоимость запроса зависит от числа стран и жанров, а не строк.
+# Куб строится по связям трек -> жанр (tracks.link_frame): популярность жанра - по всем связям,
+# а потрековые показатели (explicit, темп, длительность) - только по основной связи трека,
+# чтобы трек из нескольких жанров учитывался в сумме по жанрам один раз.
+
+TEMPO_BINS = [-np.inf, 80, 110, np.inf]
+TEMPO_LABELS = ["Медленный (0-80)", "Средний (80-110)", "Быстрый (110+)"]
+TEMPO_COLUMNS = ['tempo_slow', 'tempo_mid', 'tempo_fast']
+# Столбцы треков, нужные кубу
+CUBE_COLUMNS = ['country', 'popularity', 'explicit', 'duration_ms', 'tempo']
+
+
+def build_country_cube(links):
+    primary = links['primary'].to_numpy()
+    tempo_bucket = pd.cut(links['tempo'], bins=TEMPO_BINS, right=False, labels=TEMPO_COLUMNS)
+    data = pd.DataFrame({
+        'country': links['country'],
+        'track_genre': links['track_genre'],
+        'popularity': links['popularity'].astype('int64'),
+        'primary': primary.astype('int64'),
+        'explicit': (links['explicit'].to_numpy() & primary).astype('int64'),
+        # Длительность не основных связей - пропуск: min, max и count её не видят
+        'duration_ms': links['duration_ms'].where(primary).astype('float64'),
+    })
+    tempo_counts = pd.get_dummies(tempo_bucket).astype('int64').mul(primary.astype('int64'), axis=0)
+    data = pd.concat([data, tempo_counts], axis=1)
+
+    cube = data.groupby(['country', 'track_genre'], observed=True).agg(
+        pop_sum=('popularity', 'sum'),
+        pop_count=('popularity', 'size'),
+        track_count=('primary', 'sum'),
+        explicit_count=('explicit', 'sum'),
+        tempo_slow=('tempo_slow', 'sum'),
+        tempo_mid=('tempo_mid', 'sum'),
+        tempo_fast=('tempo_fast', 'sum'),
+        dur_sum=('duration_ms', 'sum'),
+        dur_count=('duration_ms', 'count'),
+        dur_min=('duration_ms', 'min'),
+        dur_max=('duration_ms', 'max'),
+    )
+    return cube
+
+
+def merge_cubes(*cubes):
+    # Объединение кубов по разным наборам строк (например, старые и дописанные треки)
+    grouped = pd.concat(cubes).groupby(level=['country', 'track_genre'], observed=True)
+    merged = grouped.sum()
+    merged['dur_min'] = grouped['dur_min'].min()
+    merged['dur_max'] = grouped['dur_max'].max()
+    return merged[cubes[0].columns]
+
+
+def select_cube(cube, selected_countries):
+    if not selected_countries:
+        return cube
+    mask = cube.index.get_level_values('country').isin(selected_countries)
+    return cube[mask]
+
+
+def query_cube(cube, selected_countries):
+    part = select_cube(cube, selected_countries)
+
+    by_genre = part.groupby(level='track_genre', observed=True)[['pop_sum', 'pop_count']].sum()
+    genre_popularity = (by_genre['pop_sum'] / by_genre['pop_count']).rename('popularity')
+
+    track_count = int(part['track_count'].sum())
+    tempo_counts = pd.Series(part[TEMPO_COLUMNS].sum().to_numpy(), index=TEMPO_LABELS)
+    dur_count = int(part['dur_count'].sum())
+
+    return {
+        'genre_popularity': genre_popularity,
+        'track_count': track_count,
+        'explicit_share': part['explicit_count'].sum() / track_count if track_count else np.nan,
+        'tempo_counts': tempo_counts,
+        'dur_min': part['dur_min'].min() if dur_count else np.nan,
+        'dur_mean': part['dur_sum'].sum() / dur_count if dur_count else np.nan,
+        'dur_max': part['dur_max'].max() if dur_count else np.nan,
+    }
+
+
+def cube_payload(cube):
+    # Компактное представление куба для dcc.Store: словари стран/жанров и столбцы с кодами
+    countries = cube.index.get_level_values('country')
+    genres = cube.index.get_level_values('track_genre')
+    country_codes, country_names = pd.factorize(countries)
+    genre_codes, genre_names = pd.factorize(genres)
+    payload = {
+        'countries': [str(name) for name in country_names],
+        'genres': [str(name) for name in genre_names],
+        'tempo_labels': TEMPO_LABELS,
+        'country': country_codes.tolist(),
+        'genre': genre_codes.tolist(),
+    }
+    for column in cube.columns:
+        # У групп без основных связей нет длительности: NaN недопустим в JSON
+        payload[column] = cube[column].astype(object).where(cube[column].notna(), None).tolist()
+    return payload
+
+
+HEATMAP_BINS = 50
+HEATMAP_COLUMNS = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness',
+                   'instrumentalness', 'liveness', 'valence', 'tempo', 'popularity', 'duration_ms']
+
+
+def feature_ranges(df, columns=HEATMAP_COLUMNS):
+    # Границы осей по всей таблице, чтобы сетка не зависела от выборки
+    values = df[columns]
+    return {column: (float(values[column].min()), float(values[column].max())) for column in columns}
+
+
+def bin_index(values, low, high, bins):
+    scale = bins / (high - low) if high > low else 0.0
+    index = ((values.astype(np.float64) - low) * scale).astype(np.int64)
+    return np.clip(index, 0, bins - 1)
+
+
+def binned_counts(df, x_column, y_column, ranges, bins=HEATMAP_BINS, rows=None):
+    """Двумерная гистограмма bins × bins: строки - ось y, столбцы - ось x; rows - номера строк выборки."""
+    # Берём только два нужных столбца, а не копию всех столбцов выборки
+    x = df[x_column].to_numpy()
+    y = df[y_column].to_numpy()
+    if rows is not None:
+        x, y = x[rows], y[rows]
+    valid = ~(np.isnan(x) | np.isnan(y))
+    flat = bin_index(y[valid], *ranges[y_column], bins) * bins + bin_index(x[valid], *ranges[x_column], bins)
+    return np.bincount(flat, minlength=bins * bins).reshape(bins, bins)
+
+
+def bin_centers(low, high, bins=HEATMAP_BINS):
+    step = (high - low) / bins
+    return (low + step * (np.arange(bins) + 0.5)).tolist()
@@ -1,17 +1,53 @@
+import gc
+import os
+import time
+
 import dash
 from dash import html, dcc, Input, Output
 import dash_bootstrap_components as dbc
 
+import dataset
+import export
+import metrics
+import reloader
+import serialization
+
+# Режим запуска: preload - данные и все производные готовятся при импорте
+# (при gunicorn --preload это происходит один раз в мастере до fork воркеров),
+# lazy - всё откладывается до первого запроса к странице
+STARTUP_MODE = os.environ.get('DASHBOARD_STARTUP', 'preload')
+
+start = time.perf_counter()
+
 app = dash.Dash(__name__, use_pages=True, suppress_callback_exceptions=True,
                 external_stylesheets=[
                     dbc.themes.BOOTSTRAP,
                     'https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap'
                 ])
 server = app.server
+metrics.init_app(server)
+serialization.init_app(server)
+reloader.init_app(server)
+export.init_app(server)
+dataset.startup_timings['import_pages'] = time.perf_counter() - start
+
+if STARTUP_MODE == 'preload':
+    dataset.preload()
+    # Объекты, созданные до fork, больше не трогает сборщик мусора,
+    # иначе он портит страницы памяти, общие с мастером
+    gc.freeze()
+# Отчёт о фазах запуска печатается, когда построены все производные (dataset.Dataset.get);
+# замеры запуска и последней перезагрузки также отдаются на /metrics
+metrics.collectors.append(dataset.timing_metrics)
 
 app.layout = dbc.Container([
     dcc.Location(id='url', refresh=False),
 
+    # Выбранные страны, общие для всех страниц
+    dcc.Store(id='country-selection', storage_type='session'),
+    # Остальные фильтры страницы 1 (атрибуты треков и теги), общие для всех страниц
+    dcc.Store(id='filter-selection', storage_type='session'),
+
     html.H1("Музыкальный дашборд", style={
         'color': 'black',
         'marginBottom': '20px',
@@ -45,6 +81,19 @@ app.layout = dbc.Container([
                 'backgroundColor': '#D2F2EF'
             }
         ),
+        dbc.NavLink(
+            "Похожие треки",
+            href="/similar",
+            id="nav-link-3",
+            style={
+                'color': '#242424',
+                'marginRight': '10px',
+                'padding': '8px 16px',
+                'borderRadius': '5px',
+                'transition': 'all 0.3s ease',
+                'backgroundColor': '#D2F2EF'
+            }
+        ),
     ], pills=True, className="mb-4", style={
         'backgroundColor': '#D2F2EF',
         'borderRadius': '10px',
@@ -52,6 +101,21 @@ app.layout = dbc.Container([
         'marginBottom': '20px'
     }),
 
+    # Поиск трека или исполнителя; варианты подбирает callback на странице трека
+    dcc.Dropdown(
+        id='search-box',
+        options=[],
+        placeholder="Поиск трека или исполнителя",
+        searchable=True,
+        clearable=True,
+        style={
+            'borderRadius': '20px',
+            'color': 'black',
+            'fontSize': '16px',
+            'marginBottom': '20px'
+        }
+    ),
+
     dash.page_container,
 
     # Скрытый компонент для callback'а
@@ -90,4 +154,5 @@ app.clientside_callback(
 )
 
 if __name__ == "__main__":
+    # Сервер разработки; несколько воркеров с общей памятью данных - python serve.py
     app.run(debug=True)
\ No newline at end of file
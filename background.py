@@ -0,0 +1,89 @@
+import os
+import sys
+
+from dash import Input
+
+import dataset
+import metrics
+from figure_cache import figure_cache
+
+# Фоновое выполнение тяжёлых callback'ов страниц 1 и 2.
+# С DASHBOARD_BACKGROUND_CALLBACKS=1 и установленным diskcache callback'и запускаются
+# задачами DiskcacheManager (без внешнего брокера): Dash сам отменяет задачу, если от того же
+# клиента пришёл новый запрос, а уход со страницы отменяет всё незавершённое.
+# Частые изменения фильтров дополнительно сглаживаются на клиенте (debounce).
+# Задача выполняется в отдельном процессе, поэтому кэш фигур в памяти сервера ей не виден:
+# в фоновом режиме кэш всегда хранится в SQLite (см. figure_cache), а замеры фаз
+# передаются серверу через тот же diskcache и учитываются при выдаче результата.
+
+BACKGROUND_CALLBACKS = os.environ.get('DASHBOARD_BACKGROUND_CALLBACKS') == '1'
+JOBS_DIR = os.environ.get('DASHBOARD_JOBS_DIR', os.path.join(dataset.CACHE_DIR, 'jobs'))
+DEBOUNCE_MS = int(os.environ.get('DASHBOARD_DEBOUNCE_MS', '250'))
+
+try:
+    import diskcache
+    from dash import DiskcacheManager
+except ImportError:
+    diskcache = None
+
+manager = None
+if BACKGROUND_CALLBACKS:
+    if diskcache is None:
+        print("DASHBOARD_BACKGROUND_CALLBACKS=1, но diskcache не установлен: "
+              "callback'и выполняются синхронно", file=sys.stderr)
+    else:
+        manager = DiskcacheManager(diskcache.Cache(JOBS_DIR))
+
+# Сколько хранить замеры задачи, результат которой так и не запросили
+JOB_TIMINGS_EXPIRE = 600
+
+
+def _timings_key(job):
+    return f'job-timings-{job}'
+
+
+def _report_job_timings(callback_name, phases):
+    # Номер задачи у DiskcacheManager - pid её процесса, браузер присылает его в запросе результата
+    manager.handle.set(_timings_key(os.getpid()), (callback_name, list(phases)), expire=JOB_TIMINGS_EXPIRE)
+
+
+def _take_job_timings(job):
+    return manager.handle.pop(_timings_key(job), default=None)
+
+
+def _init_job_process(_):
+    metrics.job_reporter = _report_job_timings
+    # Процесс задачи завершается через os._exit, без atexit: счётчики запросов к кэшу фигур
+    # пишем сразу, а унаследованные от сервера оставляем серверу
+    figure_cache.forget_pending()
+    figure_cache.flush_seconds = 0
+
+
+if manager is not None:
+    from multiprocess import util
+
+    # Вызывается только в процессах задач, которые DiskcacheManager запускает через multiprocess
+    util.register_after_fork(manager, _init_job_process)
+    metrics.job_timings = _take_job_timings
+
+
+def callback_options():
+    """Дополнительные аргументы для dash.callback: фоновый режим, если он включён."""
+    if manager is None:
+        return {}
+    return {'background': True, 'manager': manager, 'cancel': [Input('url', 'pathname')]}
+
+
+def debounced(function_js, key):
+    # Клиентский callback отдаёт результат, только если за DEBOUNCE_MS не пришло новых значений;
+    # промежуточные значения не доходят до сервера
+    return f"""
+    function(...args) {{
+        const inner = {function_js.strip()};
+        const timers = window.dashboardDebounce = window.dashboardDebounce || {{}};
+        const token = timers['{key}'] = (timers['{key}'] || 0) + 1;
+        return new Promise(resolve => setTimeout(() => resolve(
+            timers['{key}'] === token ? inner(...args) : window.dash_clientside.no_update
+        ), {DEBOUNCE_MS}));
+    }}
+    """
@@ -0,0 +1,112 @@
+import argparse
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+# Генератор синтетической таблицы треков в формате cleaned_dat.csv.
+# Распределения стран, жанров и стилей берутся из исходного файла,
+# остальные столбцы генерируются в диапазонах реальных данных.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PATH = os.path.join(BASE_DIR, 'cleaned_dat.csv')
+
+COLUMNS = ['id', 'track_id', 'artists', 'style', 'country', 'album_name', 'track_name', 'popularity',
+           'duration_ms', 'explicit', 'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+           'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'time_signature', 'track_genre']
+
+CHUNK_ROWS = 500_000
+TRACKS_PER_ARTIST = 9
+# Доля строк, которые повторяют уже существующий трек с другим жанром (как в исходных данных)
+DUPLICATE_SHARE = 0.18
+
+ID_ALPHABET = np.array(list(string.ascii_letters + string.digits))
+
+
+def value_distribution(sample, column):
+    counts = sample[column].value_counts(normalize=True)
+    return counts.index.to_numpy(), counts.to_numpy()
+
+
+def random_ids(rng, n, length=22):
+    chars = ID_ALPHABET[rng.integers(0, len(ID_ALPHABET), size=(n, length))]
+    return chars.view(f'<U{length}').ravel()
+
+
+def generate_chunk(rng, start, n, artist_country, artist_style, distributions):
+    genres, genre_p = distributions['track_genre']
+    artist_ids = rng.integers(0, len(artist_country), size=n)
+    track_numbers = start + np.arange(n)
+
+    chunk = pd.DataFrame({
+        'id': track_numbers,
+        'track_id': random_ids(rng, n),
+        'artists': np.char.add('Artist ', artist_ids.astype(str)),
+        'style': artist_style[artist_ids],
+        'country': artist_country[artist_ids],
+        'album_name': np.char.add('Album ', (track_numbers // 12).astype(str)),
+        'track_name': np.char.add('Track ', track_numbers.astype(str)),
+        'popularity': np.clip(rng.normal(35, 20, n), 0, 100).astype(int),
+        'duration_ms': np.clip(rng.lognormal(12.3, 0.35, n), 30_000, 1_800_000).astype(int),
+        'explicit': rng.random(n) < 0.07,
+        'danceability': rng.beta(5, 3, n).round(3),
+        'energy': rng.beta(3, 2, n).round(3),
+        'key': rng.integers(0, 12, n),
+        'loudness': np.clip(rng.normal(-8, 5, n), -42, 1).round(3),
+        'mode': (rng.random(n) < 0.63).astype(int),
+        'speechiness': rng.beta(1, 12, n).round(4),
+        'acousticness': rng.beta(0.6, 1.5, n).round(4),
+        'instrumentalness': rng.beta(0.2, 1.5, n).round(5),
+        'liveness': rng.beta(1.5, 6, n).round(4),
+        'valence': rng.beta(2, 2, n).round(3),
+        'tempo': np.clip(rng.normal(122, 30, n), 0, 244).round(3),
+        'time_signature': rng.choice([3, 4, 5, 1], size=n, p=[0.08, 0.89, 0.02, 0.01]),
+        'track_genre': rng.choice(genres, size=n, p=genre_p),
+    }, columns=COLUMNS)
+
+    # Часть строк - те же треки в другом жанре
+    n_duplicates = int(n * DUPLICATE_SHARE)
+    if n_duplicates:
+        source = rng.integers(0, n - n_duplicates, size=n_duplicates)
+        target = np.arange(n - n_duplicates, n)
+        for column in COLUMNS:
+            if column not in ('id', 'track_genre'):
+                chunk.loc[target, column] = chunk[column].to_numpy()[source]
+    return chunk
+
+
+def generate(rows, path, seed=0, chunk_rows=CHUNK_ROWS, sample_path=SAMPLE_PATH):
+    rng = np.random.default_rng(seed)
+    sample = pd.read_csv(sample_path, usecols=['country', 'track_genre', 'style'])
+    distributions = {column: value_distribution(sample, column) for column in sample.columns}
+    n_artists = max(rows // TRACKS_PER_ARTIST, 1)
+
+    # У исполнителя одна страна и один стиль, как после объединения таблиц в data.py
+    countries, country_p = distributions['country']
+    styles, style_p = distributions['style']
+    artist_country = rng.choice(countries, size=n_artists, p=country_p)
+    artist_style = rng.choice(styles, size=n_artists, p=style_p)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            chunk = generate_chunk(rng, start, n, artist_country, artist_style, distributions)
+            chunk.to_csv(f, index=False, header=start == 0)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетическая таблица треков для бенчмарков')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('output')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.rows, args.output, args.seed)
+    print(f"Сгенерировано {args.rows} строк: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
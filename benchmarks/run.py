@@ -0,0 +1,150 @@
+import argparse
+import inspect
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from generate import generate
+
+# Бенчмарк дашборда на синтетических данных разного размера.
+# Каждый размер измеряется в отдельном процессе, чтобы пиковая память
+# и время холодной загрузки не зависели от предыдущих прогонов.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+
+DEFAULT_SIZES = [10_000, 1_000_000, 10_000_000]
+SELECTION_SIZES = [0, 1, 5, 20]
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'max': max(times)}
+
+
+def peak_rss_mb():
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_worker(repeat):
+    # Запускается в дочернем процессе с MUSIC_DATA_PATH и MUSIC_CACHE_DIR из окружения
+    sys.path.insert(0, BASE_DIR)
+    results = {}
+
+    import dataset
+
+    start = time.perf_counter()
+    data = dataset.current()
+    df = data.df
+    results['load_cold'] = time.perf_counter() - start
+    results['load_warm'] = timed(lambda: dataset.load_tracks(), 1)['min']
+    results['rows'] = len(data.links)
+    results['tracks'] = len(df)
+
+    start = time.perf_counter()
+    import app  # noqa: F401
+    import pages.page1 as page1
+    import pages.page2 as page2
+    from topk import CountryTopK
+    results['import_pages'] = time.perf_counter() - start
+    results['derived'] = timed(lambda: dataset.current().build_all(), 1)['min']
+
+    # Замеряем сами вычисления, минуя кэш фигур
+    update_all_charts = inspect.unwrap(page1.update_all_charts)
+    update_map = inspect.unwrap(page2.update_map)
+    update_top_lists = inspect.unwrap(page2.update_top_lists)
+    update_quantiles = inspect.unwrap(page1.update_quantiles)
+    countries = df['country'].value_counts().index.tolist()
+
+    results['update_all_charts'] = {}
+    results['update_map'] = {}
+    results['update_top_lists'] = {}
+    results['update_quantiles'] = {}
+    for size in SELECTION_SIZES:
+        selection = countries[:size]
+        results['update_all_charts'][size] = timed(lambda: update_all_charts(selection), repeat)
+        results['update_map'][size] = timed(lambda: update_map(selection), repeat)
+        results['update_top_lists'][size] = timed(lambda: update_top_lists(selection), repeat)
+        results['update_quantiles'][size] = timed(lambda: update_quantiles(selection, None), repeat)
+
+    results['build_country_topk'] = timed(lambda: CountryTopK.build(df), repeat)
+    results['peak_rss_mb'] = peak_rss_mb()
+    print(json.dumps(results))
+
+
+def dataset_path(rows, seed):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'tracks_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        print(f"Генерация {rows} строк...", file=sys.stderr)
+        generate(rows, path, seed)
+    return path
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(rows, seed, repeat):
+    path = dataset_path(rows, seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, MUSIC_DATA_PATH=path, MUSIC_CACHE_DIR=cache_dir, DASHBOARD_STARTUP='lazy')
+        output = subprocess.run([sys.executable, __file__, '--worker', '--repeat', str(repeat)],
+                                env=env, cwd=BASE_DIR, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк дашборда на синтетических данных')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON-файл с результатами')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.repeat)
+        return
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for rows in args.sizes:
+        print(f"Размер {rows}...", file=sys.stderr)
+        report['results'][rows] = run_size(rows, args.seed, args.repeat)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
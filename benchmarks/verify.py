@@ -0,0 +1,232 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import traceback
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from run import BASE_DIR, dataset_path
+
+# Проверки корректности на синтетических данных: тестов в репозитории нет, поэтому инварианты,
+# которые легко сломать оптимизацией, проверяются этим скриптом.
+#   python benchmarks/verify.py --rows 20000
+# Скетчи числа исполнителей строятся только с DASHBOARD_APPROX_DISTINCT=1 - так проверяются и они.
+# Каждая проверка - функция check_*(data, client); при расхождении она падает с AssertionError.
+
+CHECKS = []
+# Доля строк файла, загружаемая сразу; остальные дописываются и подхватываются перезагрузкой
+INITIAL_SHARE = 0.7
+# Дописываемый хвост файла (заполняет main)
+_appended_tail = {'data_path': None, 'tail': b''}
+
+
+def check(func):
+    CHECKS.append(func)
+    return func
+
+
+def _plain(frame):
+    # Категории у дозагруженной и свежей таблицы могут идти в разном порядке: сравниваем значения
+    frame = frame.reset_index()
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(object)
+    return frame
+
+
+def _same_frame(left, right, what, sort_by=None):
+    left, right = _plain(left), _plain(right)
+    if sort_by:
+        left = left.sort_values(sort_by, ignore_index=True)
+        right = right.sort_values(sort_by, ignore_index=True)
+    pd.testing.assert_frame_equal(left, right, check_dtype=False, check_index_type=False, obj=what)
+
+
+def _compare_cube(appended, fresh, sample):
+    index = list(appended.index.names)
+    _same_frame(appended, fresh, 'country_cube', sort_by=index)
+
+
+def _compare_tag_index(appended, fresh, sample):
+    assert sorted(appended.tags) == sorted(fresh.tags), 'tag_index: словарь тегов'
+    for tag in fresh.tags:
+        assert np.array_equal(np.sort(appended.rows_for(tag)), np.sort(fresh.rows_for(tag))), f'tag_index: {tag}'
+
+
+def _compare_filter_index(appended, fresh, sample):
+    for filters in sample['filters']:
+        assert np.array_equal(appended.rows(filters), fresh.rows(filters)), f'filter_index: {filters}'
+
+
+def _compare_quantile_sketches(appended, fresh, sample):
+    assert set(appended) == set(fresh), 'quantile_sketches: столбцы'
+    for column, sketch in fresh.items():
+        for countries in sample['countries']:
+            assert np.array_equal(np.trim_zeros(appended[column].histogram(countries), 'b'),
+                                  np.trim_zeros(sketch.histogram(countries), 'b')), \
+                f'quantile_sketches[{column}]: {countries}'
+
+
+def _compare_artist_sketches(appended, fresh, sample):
+    for countries in sample['countries']:
+        _same_frame(appended.by_country(countries), fresh.by_country(countries), f'artist_sketches: {countries}')
+
+
+def _compare_topk(appended, fresh, sample):
+    # При равной популярности на границе топа состав может законно различаться, поэтому сравниваем значения
+    for countries in sample['countries']:
+        assert (appended.query_tracks(countries)['popularity'].tolist()
+                == fresh.query_tracks(countries)['popularity'].tolist()), f'country_topk tracks: {countries}'
+        assert (appended.query_artists(countries)['total_popularity'].tolist()
+                == fresh.query_artists(countries)['total_popularity'].tolist()), f'country_topk artists: {countries}'
+
+
+def _compare_search(appended, fresh, sample):
+    for query in sample['queries']:
+        found = [sorted((r['kind'], r['id']) for r in index.search(query, limit=10 ** 9))
+                 for index in (appended, fresh)]
+        assert found[0] == found[1], f'search_index: {query!r}'
+
+
+# Производные структуры, которые сравниваются по содержимому; остальные строятся заново
+# по таблицам треков и связей, и для них достаточно совпадения самих таблиц
+COMPARERS = {
+    'country_cube': _compare_cube,
+    'tag_index': _compare_tag_index,
+    'filter_index': _compare_filter_index,
+    'quantile_sketches': _compare_quantile_sketches,
+    'artist_sketches': _compare_artist_sketches,
+    'country_topk': _compare_topk,
+    'search_index': _compare_search,
+}
+
+
+@check
+def check_append_matches_full_build(data, client):
+    import dataset
+    data.build_all()
+    with open(_appended_tail['data_path'], 'ab') as f:
+        f.write(_appended_tail['tail'])
+    assert dataset.reload(), 'перезагрузка не подхватила дописанные строки'
+    appended = dataset.current()
+    appended_names = {name[len('append_'):] for name in dataset.reload_timings
+                      if name.startswith('append_') and name != 'append_tracks'}
+    assert appended_names, 'перезагрузка прошла не через дописывание'
+    missing = appended_names - set(COMPARERS)
+    assert not missing, f'нет сравнения для дописываемых структур: {sorted(missing)}'
+
+    tracks, links, version = dataset.load_tracks(use_cache=False)
+    assert version == appended.version
+    fresh = dataset.Dataset(*dataset._prepare(tracks, links, version), version).build_all()
+
+    _same_frame(appended.df, fresh.df, 'tracks')
+    _same_frame(appended.links.drop(columns='id'), fresh.links.drop(columns='id'), 'links',
+                sort_by=['track', 'track_genre'])
+
+    countries = fresh.df['country'].value_counts().index.astype(str).tolist()
+    genres = fresh.links['track_genre'].value_counts().index.astype(str).tolist()
+    popularity = fresh.get('filter_index').value_range('popularity')
+    names = fresh.df['track_name'].dropna().astype(str)
+    sample = {
+        'countries': [None, countries[:1], countries[:5], countries[-3:]],
+        'filters': [
+            {'track_genre': genres[:2]},
+            {'explicit': [True], 'country': countries[:3]},
+            {'popularity': [popularity[0] + 10, popularity[1] - 10], 'mode': [1]},
+        ],
+        'queries': [name[:4] for name in names.iloc[::max(len(names) // 20, 1)]],
+    }
+    for name, compare in COMPARERS.items():
+        if name in fresh._derived:
+            compare(appended.get(name), fresh.get(name), sample)
+
+
+def _export(client, fmt, countries=(), filters=None):
+    params = [('country', country) for country in countries]
+    if filters is not None:
+        params.append(('filters', json.dumps(filters)))
+    response = client.get(f'/export.{fmt}?{urlencode(params)}')
+    # Потоковый ответ нужно дочитать, иначе контекст запроса не закроется
+    return response, response.get_data()
+
+
+@check
+def check_export_round_trip(data, client):
+    import export
+    countries = data.df['country'].value_counts().index[:2].tolist()
+    genres = data.links['track_genre'].value_counts().index[:3].astype(str).tolist()
+    cases = [
+        ((), None),
+        (countries, None),
+        ((), {'track_genre': genres, 'popularity': [20, 80]}),
+        (countries, {'explicit': [True], 'track_genre': genres[:1]}),
+    ]
+    formats = ['csv'] + (['parquet'] if export.pa is not None else [])
+    if export.pa is None:
+        print('  pyarrow не установлен, выгрузка parquet не проверяется', file=sys.stderr)
+    for countries, filters in cases:
+        for fmt in formats:
+            response, body = _export(client, fmt, countries, filters)
+            assert response.status_code == 200, (fmt, countries, filters, response.status_code)
+            expected = int(response.headers['X-Export-Rows'])
+            if fmt == 'parquet':
+                read = export.pq.read_table(io.BytesIO(body)).num_rows
+            else:
+                read = len(pd.read_csv(io.BytesIO(body)))
+            assert read == expected, (fmt, countries, filters, read, expected)
+
+
+@check
+def check_export_rejects_bad_filters(data, client):
+    for filters in ({'foo': [1]}, {'popularity': [80, 10]}, {'popularity': [1]}, {'track_genre': 'pop'}, [1]):
+        response, _ = _export(client, 'csv', filters=filters)
+        assert response.status_code == 400, (filters, response.status_code)
+
+
+def run_checks():
+    sys.path.insert(0, BASE_DIR)
+    import dataset
+    import app
+
+    client = app.app.server.test_client()
+    failed = 0
+    for func in CHECKS:
+        try:
+            # Проверка дописывания подменяет данные, следующие работают уже с полным файлом
+            func(dataset.current(), client)
+            print(f"OK    {func.__name__}", file=sys.stderr)
+        except Exception:
+            failed += 1
+            print(f"FAIL  {func.__name__}\n{traceback.format_exc()}", file=sys.stderr)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверки корректности дашборда на синтетических данных')
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    source = dataset_path(args.rows, args.seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Сначала загружается начало файла, хвост дописывает check_append_matches_full_build
+        data_path = os.path.join(work_dir, 'tracks.csv')
+        with open(source, 'rb') as f:
+            lines = f.readlines()
+        split = 1 + int((len(lines) - 1) * INITIAL_SHARE)
+        with open(data_path, 'wb') as f:
+            f.writelines(lines[:split])
+        _appended_tail.update(data_path=data_path, tail=b''.join(lines[split:]))
+        os.environ.update(MUSIC_DATA_PATH=data_path, MUSIC_CACHE_DIR=os.path.join(work_dir, 'cache'),
+                          DASHBOARD_STARTUP='lazy')
+        failed = run_checks()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,225 @@
-import pandas as pd
-
-import pandas as pd
+import argparse
+import hashlib
+import io
+import json
+import os
+from urllib.parse import quote, unquote
+from urllib.request import urlopen
 
 import pandas as pd
 
-# Загрузка данных из первой таблицы
+# Таблица треков (первая таблица)
 url_table1 = 'https://docs.google.com/spreadsheets/d/e/2PACX-1vSOkW9JzizLG6c1Mg637Cx_HDOD7id5F1b9OlvDK4tQyryWYcLS08yD4j_ezOlF9RAuD1RBcPUw6CXE/pub?gid=588798097&single=true&output=csv'
-df_table1 = pd.read_csv(url_table1)
 
-# Загрузка данных из второй таблицы
+# Таблица исполнителей (вторая таблица)
 url_table2 = 'https://docs.google.com/spreadsheets/d/e/2PACX-1vSOkW9JzizLG6c1Mg637Cx_HDOD7id5F1b9OlvDK4tQyryWYcLS08yD4j_ezOlF9RAuD1RBcPUw6CXE/pub?gid=1666822727&single=true&output=csv'
-df_table2 = pd.read_csv(url_table2)
-
-# Объединение таблиц по имени исполнителя
-merged_df = pd.merge(
-    df_table1,
-    df_table2[['artist_mb', 'country_lastfm', 'tags_lastfm']],
-    left_on='artists',
-    right_on='artist_mb',
-    how='left'
-)
-
-# Удаление временного столбца
-if 'artist_mb' in merged_df.columns:
-    merged_df.drop('artist_mb', axis=1, inplace=True)
-
-# Переименование столбцов (country_lastfm -> style, tags_lastfm -> country)
-merged_df.rename(
-    columns={
-        'country_lastfm': 'style',
-        'tags_lastfm': 'country'
-    },
-    inplace=True
-)
-
-# Удаление строк с пропущенными значениями
-df_cleaned = merged_df.dropna()
-
-# Сохранение результата в файл
-df_cleaned.to_csv('cleaned_data.csv', index=False)
+
+OUTPUT_DIR = 'cleaned_data'
+STATE_DIR = '.pipeline'
+ARTIST_COLUMNS = ['artist_mb', 'country_lastfm', 'tags_lastfm']
+
+try:
+    import pyarrow  # noqa: F401
+    PARTITION_FORMAT = 'parquet'
+except ImportError:
+    PARTITION_FORMAT = 'csv'
+
+
+def read_source(source):
+    # Источник - ссылка на опубликованную таблицу или локальный файл
+    if source.startswith(('http://', 'https://')):
+        with urlopen(source) as response:
+            raw = response.read()
+    else:
+        with open(source, 'rb') as f:
+            raw = f.read()
+    return raw, hashlib.sha256(raw).hexdigest()
+
+
+def normalize_artist_key(names):
+    return (names.astype(str)
+            .str.normalize('NFKC')
+            .str.casefold()
+            .str.strip()
+            .str.replace(r'\s+', ' ', regex=True))
+
+
+def hash_by_artist(df, columns):
+    # Хэш всех строк исполнителя; сумма не зависит от порядка строк
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    return row_hashes.groupby(df['artist_key']).sum()
+
+
+def load_state(state_dir):
+    try:
+        with open(os.path.join(state_dir, 'state.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, 'state.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def partition_path(output_dir, country):
+    return os.path.join(output_dir, f'country={quote(str(country), safe="")}', f'part.{PARTITION_FORMAT}')
+
+
+def read_partition(output_dir, country):
+    path = partition_path(output_dir, country)
+    if not os.path.exists(path):
+        return None
+    part = pd.read_parquet(path) if PARTITION_FORMAT == 'parquet' else pd.read_csv(path)
+    part['country'] = country
+    return part
+
+
+def write_partition(output_dir, country, part):
+    path = partition_path(output_dir, country)
+    if part.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        if os.path.isdir(os.path.dirname(path)):
+            os.rmdir(os.path.dirname(path))
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = part.drop(columns='country')
+    tmp_path = path + '.tmp'
+    if PARTITION_FORMAT == 'parquet':
+        part.to_parquet(tmp_path, index=False)
+    else:
+        part.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def list_partitions(output_dir):
+    if not os.path.isdir(output_dir):
+        return []
+    return [unquote(name[len('country='):]) for name in sorted(os.listdir(output_dir))
+            if name.startswith('country=')]
+
+
+def merge_tables(tracks, artists):
+    # Объединение таблиц по нормализованному имени исполнителя
+    merged_df = pd.merge(tracks, artists, on='artist_key', how='left')
+
+    # Удаление временных столбцов
+    merged_df.drop(columns=['artist_key', 'artist_mb'], inplace=True)
+
+    # Переименование столбцов (country_lastfm -> style, tags_lastfm -> country)
+    merged_df.rename(
+        columns={
+            'country_lastfm': 'style',
+            'tags_lastfm': 'country'
+        },
+        inplace=True
+    )
+
+    # Удаление строк с пропущенными значениями
+    return merged_df.dropna()
+
+
+def write_csv(output_dir, csv_path):
+    parts = [read_partition(output_dir, country) for country in list_partitions(output_dir)]
+    pd.concat(parts, ignore_index=True).to_csv(csv_path, index=False)
+    print(f"Сохранён файл {csv_path}")
+
+
+def run_pipeline(tracks_source, artists_source, output_dir=OUTPUT_DIR, state_dir=STATE_DIR,
+                 csv_path=None, force=False):
+    state = {} if force else load_state(state_dir)
+    if state.get('output_dir') != output_dir or state.get('format') != PARTITION_FORMAT:
+        state = {}
+
+    tracks_raw, tracks_hash = read_source(tracks_source)
+    artists_raw, artists_hash = read_source(artists_source)
+    inputs = {'tracks': tracks_hash, 'artists': artists_hash}
+    if state.get('inputs') == inputs:
+        print("Входные данные не изменились, пересборка не нужна.")
+        # Партиции актуальны, но единый CSV мог быть запрошен по новому пути
+        if csv_path:
+            write_csv(output_dir, csv_path)
+        return
+
+    tracks = pd.read_csv(io.BytesIO(tracks_raw))
+    artists = pd.read_csv(io.BytesIO(artists_raw), usecols=ARTIST_COLUMNS)
+    del tracks_raw, artists_raw
+
+    tracks['artist_key'] = normalize_artist_key(tracks['artists'])
+    artists['artist_key'] = normalize_artist_key(artists['artist_mb'])
+    artists = artists.drop_duplicates('artist_key')
+
+    # Версия исполнителя = хэш его треков + хэш его строки в таблице исполнителей
+    track_hashes = hash_by_artist(tracks, [c for c in tracks.columns if c != 'artist_key'])
+    artist_hashes = hash_by_artist(artists, ['country_lastfm', 'tags_lastfm'])
+    artist_hashes = artist_hashes.reindex(track_hashes.index, fill_value=0)
+    versions = {key: f'{t:x}:{a:x}' for key, t, a in
+                zip(track_hashes.index, track_hashes.to_numpy(), artist_hashes.to_numpy())}
+
+    previous = state.get('artists', {})
+    if not previous:
+        # Полная пересборка: старые партиции удаляем целиком
+        for country in list_partitions(output_dir):
+            write_partition(output_dir, country, pd.DataFrame())
+    changed = {key for key, version in versions.items() if previous.get(key, {}).get('version') != version}
+    removed = set(previous) - set(versions)
+    print(f"Исполнителей: {len(versions)}, изменено: {len(changed)}, удалено: {len(removed)}")
+
+    merged = merge_tables(tracks[tracks['artist_key'].isin(changed)],
+                          artists[artists['artist_key'].isin(changed)])
+    merged_keys = normalize_artist_key(merged['artists'])
+
+    # Перезаписываем только те партиции, в которых есть изменённые исполнители
+    touched = changed | removed
+    countries = set(merged['country'])
+    for key in touched:
+        countries.update(previous.get(key, {}).get('countries', []))
+
+    for country in sorted(countries):
+        old = read_partition(output_dir, country)
+        new = merged[merged['country'] == country]
+        if old is not None:
+            old = old[~normalize_artist_key(old['artists']).isin(touched)]
+            new = pd.concat([old, new], ignore_index=True)
+        write_partition(output_dir, country, new)
+
+    artist_countries = merged.groupby(merged_keys)['country'].unique()
+
+    def countries_of(key):
+        if key in changed:
+            return [str(country) for country in artist_countries.get(key, [])]
+        return previous[key]['countries']
+
+    state = {
+        'inputs': inputs,
+        'output_dir': output_dir,
+        'format': PARTITION_FORMAT,
+        'artists': {key: {'version': version, 'countries': countries_of(key)}
+                    for key, version in versions.items()},
+    }
+    save_state(state_dir, state)
+    print(f"Обновлено партиций: {len(countries)}")
+
+    if csv_path:
+        write_csv(output_dir, csv_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сборка датасета дашборда из таблиц треков и исполнителей')
+    parser.add_argument('--tracks', default=url_table1, help='ссылка или путь к таблице треков')
+    parser.add_argument('--artists', default=url_table2, help='ссылка или путь к таблице исполнителей')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='каталог с партициями по странам')
+    parser.add_argument('--state-dir', default=STATE_DIR, help='каталог с состоянием предыдущего запуска')
+    parser.add_argument('--csv', default=None, help='дополнительно собрать единый CSV-файл')
+    parser.add_argument('--force', action='store_true', help='пересобрать всё с нуля')
+    args = parser.parse_args()
+    run_pipeline(args.tracks, args.artists, args.output_dir, args.state_dir, args.csv, args.force)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from aggregates import CUBE_COLUMNS, build_country_cube, merge_cubes
+from filters import FilterIndex
+from tags import TagIndex
+from tracks import RowGroups, append_tracks, link_frame, split_tracks
+
+# Общий слой данных для всех страниц дашборда.
+# CSV разбирается один раз (при первом обращении к current()) и раскладывается на каноническую
+# таблицу треков и таблицу связей трек -> жанр (см. tracks.py). Обе сохраняются в бинарный кэш
+# и перечитываются из него, пока исходный файл не изменится.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.environ.get('MUSIC_DATA_PATH', os.path.join(BASE_DIR, 'cleaned_dat.csv'))
+CACHE_DIR = os.environ.get('MUSIC_CACHE_DIR', os.path.join(BASE_DIR, '.cache'))
+
+# Общие для всех воркеров массивы: числовые столбцы и коды категорий выгружаются в .npy
+# и отображаются в память (mmap) каждым процессом, страницы файла делятся через page cache
+SHARED_ARRAYS = os.environ.get('DASHBOARD_SHARED_ARRAYS') == '1'
+SHARED_DIR = os.environ.get('DASHBOARD_SHARED_DIR', os.path.join(CACHE_DIR, 'shared'))
+
+# Столбец с тегами Last.fm (несколько тегов через ';')
+TAG_COLUMN = os.environ.get('MUSIC_TAG_COLUMN', 'style')
+
+CATEGORY_COLUMNS = ['country', 'style', 'track_genre', 'artists']
+FLOAT_COLUMNS = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness',
+                 'instrumentalness', 'liveness', 'valence', 'tempo']
+INT_COLUMNS = ['id', 'popularity', 'duration_ms', 'key', 'mode', 'time_signature']
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'feather'
+except ImportError:
+    # Без pyarrow используем pickle: он тоже сохраняет категориальные типы
+    CACHE_FORMAT = 'pickle'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def optimize_types(df):
+    # Часть значений в CSV записана с запятой ("1,00E-05"), приводим к числам
+    for col in FLOAT_COLUMNS:
+        if df[col].dtype == object:
+            df[col] = pd.to_numeric(df[col].str.replace(',', '.', regex=False), errors='coerce')
+        df[col] = df[col].astype('float32')
+    for col in INT_COLUMNS:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    df['explicit'] = df['explicit'].fillna(False).astype(bool)
+    return df
+
+
+def read_source(path):
+    return optimize_types(pd.read_csv(path))
+
+
+def _cache_paths(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (os.path.join(CACHE_DIR, f'{name}.tracks.{CACHE_FORMAT}'),
+            os.path.join(CACHE_DIR, f'{name}.links.{CACHE_FORMAT}'),
+            os.path.join(CACHE_DIR, f'{name}.meta.json'))
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _read_cache(cache_path):
+    if CACHE_FORMAT == 'feather':
+        return pd.read_feather(cache_path)
+    return pd.read_pickle(cache_path)
+
+
+def _write_cache(df, cache_path):
+    tmp_path = cache_path + '.tmp'
+    if CACHE_FORMAT == 'feather':
+        df.reset_index(drop=True).to_feather(tmp_path)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def _write_tables(tracks, links, stat, digest, path=DATA_PATH):
+    tracks_path, links_path, meta_path = _cache_paths(path)
+    _write_cache(tracks, tracks_path)
+    _write_cache(links, links_path)
+    _write_meta(meta_path, {'hash': digest, 'mtime': stat.st_mtime,
+                            'size': stat.st_size, 'format': CACHE_FORMAT})
+
+
+def load_tracks(path=DATA_PATH, use_cache=True):
+    """Возвращает (канонические треки, связи трек -> жанр, версия данных)."""
+    stat = os.stat(path)
+    if not use_cache:
+        return (*split_tracks(read_source(path)), file_hash(path))
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tracks_path, links_path, meta_path = _cache_paths(path)
+    meta = _read_meta(meta_path)
+
+    if (meta and os.path.exists(tracks_path) and os.path.exists(links_path)
+            and meta.get('format') == CACHE_FORMAT):
+        # Быстрая проверка по mtime и размеру, хэш считаем только если они изменились
+        if meta['mtime'] == stat.st_mtime and meta['size'] == stat.st_size:
+            return _read_cache(tracks_path), _read_cache(links_path), meta['hash']
+        digest = file_hash(path)
+        if meta['hash'] == digest:
+            meta.update(mtime=stat.st_mtime, size=stat.st_size)
+            _write_meta(meta_path, meta)
+            return _read_cache(tracks_path), _read_cache(links_path), digest
+    else:
+        digest = file_hash(path)
+
+    tracks, links = split_tracks(read_source(path))
+    _write_tables(tracks, links, stat, digest, path)
+    return tracks, links, digest
+
+
+def _mapped_array(path, values):
+    # Файл пишет первый процесс, остальные только отображают готовый
+    if not os.path.exists(path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(values))
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+
+def share_columns(df, version, name):
+    """Таблица, у которой числовые столбцы и коды категорий отображены из файлов версии данных."""
+    directory = os.path.join(SHARED_DIR, version[:16])
+    os.makedirs(directory, exist_ok=True)
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Порядок категорий у дописанной и заново загруженной таблицы одной версии разный,
+            # поэтому коды одной версии различаются ещё и по словарю категорий
+            categories = hashlib.sha256('\0'.join(map(str, values.cat.categories)).encode('utf-8')).hexdigest()[:12]
+            codes = _mapped_array(os.path.join(directory, f'{name}.{col}.{categories}.codes.npy'),
+                                  values.cat.codes.to_numpy())
+            columns[col] = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        elif values.dtype.kind in 'biuf':
+            columns[col] = _mapped_array(os.path.join(directory, f'{name}.{col}.npy'), values.to_numpy())
+        else:
+            # Строки (track_id, названия) остаются в памяти процесса
+            columns[col] = values.to_numpy()
+    # copy=False: pandas не склеивает столбцы одного типа в общий блок и не копирует отображения
+    shared = pd.DataFrame(columns, copy=False)
+
+    # Файлы прошлых версий удаляем: уже отображённые страницы остаются доступны до закрытия
+    for other in os.listdir(SHARED_DIR):
+        if other != version[:16]:
+            shutil.rmtree(os.path.join(SHARED_DIR, other), ignore_errors=True)
+    return shared
+
+
+def _prepare(tracks, links, version):
+    if not SHARED_ARRAYS:
+        return tracks, links
+    return share_columns(tracks, version, 'tracks'), share_columns(links, version, 'links')
+
+
+def append_rows(df, new_rows):
+    # Склеиваем таблицы, сохраняя категориальные столбцы категориальными
+    columns = {}
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            columns[col] = union_categoricals([df[col], new_rows[col]])
+        else:
+            columns[col] = pd.concat([df[col], new_rows[col]], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+class Dataset:
+    # Таблица треков (df - по строке на трек), связи трек -> жанр (links)
+    # и производные от них структуры одной версии данных.
+    # Производные (агрегаты, каркасы фигур) строятся при первом обращении
+    # зарегистрированными функциями и живут, пока жива эта версия.
+    # Объект не меняется после публикации: перезагрузка создаёт новый и подменяет ссылку.
+
+    def __init__(self, df, links, version, size=None, mtime=None, timings=None):
+        self.df = df
+        self.links = links
+        self.version = version
+        self.size = size
+        self.mtime = mtime
+        # Куда записываются замеры построения производных: запуск или перезагрузка
+        self.timings = startup_timings if timings is None else timings
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def get(self, name):
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    with timed(name, self.timings):
+                        value = self._derived[name] = _builders[name](self)
+                    self._report_if_complete()
+        return value
+
+    def _report_if_complete(self):
+        # Отчёт о запуске печатается, когда первая версия данных построена целиком:
+        # при preload - сразу при импорте, при lazy - после первых запросов ко всем страницам
+        global _startup_reported
+        if self.timings is startup_timings and not _startup_reported and set(_builders) <= set(self._derived):
+            _startup_reported = True
+            print(startup_report(), file=sys.stderr)
+
+    def build_all(self):
+        for name in list(_builders):
+            self.get(name)
+        return self
+
+
+_builders = {}
+_appenders = {}
+_current = None
+_load_lock = threading.Lock()
+_reload_lock = threading.Lock()
+# Снимок данных, закреплённый за потоком на время одного callback'а (см. pinned)
+_pinned = threading.local()
+startup_timings = {}
+# Фазы последней перезагрузки хранятся отдельно и не затирают замеры запуска
+reload_timings = {}
+_startup_reported = False
+
+
+@contextmanager
+def timed(name, timings=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (startup_timings if timings is None else timings)[name] = time.perf_counter() - start
+
+
+def startup_report(timings=None, title='Время запуска по фазам'):
+    timings = startup_timings if timings is None else timings
+    phases = ', '.join(f'{name}={seconds:.3f}s' for name, seconds in timings.items())
+    return f"{title}: {phases}"
+
+
+def timing_metrics():
+    # Для /metrics: замеры запуска и последней перезагрузки в формате Prometheus
+    lines = []
+    for metric, timings in (('dashboard_startup_phase_seconds', startup_timings),
+                            ('dashboard_reload_phase_seconds', reload_timings)):
+        lines.append(f'# TYPE {metric} gauge')
+        lines += [f'{metric}{{phase="{name}"}} {seconds}' for name, seconds in list(timings.items())]
+    return lines
+
+
+def register_derived(name, builder, append=None):
+    # append(старое значение, новые связи) -> новое значение; новые связи - таблица tracks.link_frame
+    # со столбцами их треков и признаком основной связи (primary). Не должен менять старое значение,
+    # потому что им могут пользоваться запросы, начатые до перезагрузки
+    _builders[name] = builder
+    if append is not None:
+        _appenders[name] = append
+
+
+def current():
+    # Данные загружаются один раз на процесс при первом обращении
+    global _current
+    data = getattr(_pinned, 'data', None)
+    if data is not None:
+        return data
+    if _current is None:
+        with _load_lock:
+            if _current is None:
+                stat = os.stat(DATA_PATH)
+                with timed('load_tracks'):
+                    tracks, links, version = load_tracks()
+                    tracks, links = _prepare(tracks, links, version)
+                _current = Dataset(tracks, links, version, stat.st_size, stat.st_mtime)
+    return _current
+
+
+@contextmanager
+def pinned(data):
+    # Внутри блока current() в этом потоке возвращает data, даже если перезагрузка уже подменила
+    # данные: результат callback'а и ключ его кэша относятся к одной версии
+    previous = getattr(_pinned, 'data', None)
+    _pinned.data = data
+    try:
+        yield data
+    finally:
+        _pinned.data = previous
+
+
+def live():
+    # Последний загруженный снимок процесса, даже внутри pinned()
+    return _current if _current is not None else current()
+
+
+def derived(name):
+    return current().get(name)
+
+
+def preload():
+    # Загрузка данных и всех производных до fork воркеров: память делится copy-on-write
+    return current().build_all()
+
+
+def _read_appended(old, path):
+    # Если новый файл начинается ровно с содержимого старого, возвращает
+    # (дописанные строки, хэш нового файла), иначе None
+    if old.size is None or os.path.getsize(path) <= old.size:
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = old.size
+        while remaining:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+        if digest.hexdigest() != old.version:
+            return None
+        f.seek(old.size - 1)
+        if f.read(1) != b'\n':
+            return None
+        tail = f.read()
+    digest.update(tail)
+    # Порядок столбцов берём из заголовка файла: в памяти таблица уже разложена на треки и связи
+    columns = pd.read_csv(path, nrows=0).columns.tolist()
+    new_rows = pd.read_csv(io.BytesIO(tail), header=None, names=columns)
+    return optimize_types(new_rows), digest.hexdigest()
+
+
+def reload(full=False):
+    """Перечитывает датасет, если файл изменился; возвращает True, если данные подменены."""
+    global _current, reload_timings
+    with _reload_lock:
+        old = _current
+        if old is None:
+            return False
+        stat = os.stat(DATA_PATH)
+        if not full and (stat.st_size, stat.st_mtime) == (old.size, old.mtime):
+            return False
+
+        timings = {}
+        appended = None if full else _read_appended(old, DATA_PATH)
+        if appended is not None:
+            # Дописаны только новые строки: добавляем новые треки и связи к таблицам и к агрегатам
+            new_rows, version = appended
+            with timed('append_tracks', timings):
+                tracks, links, new_links = append_tracks(old.df, old.links, new_rows, append_rows)
+                new = Dataset(*_prepare(tracks, links, version), version, stat.st_size, stat.st_mtime, timings)
+            delta = link_frame(tracks, new_links)
+            for name, append in _appenders.items():
+                if name in old._derived:
+                    with timed(f'append_{name}', timings):
+                        new._derived[name] = append(old._derived[name], delta)
+            if os.path.isdir(CACHE_DIR):
+                _write_tables(tracks, links, stat, version)
+        else:
+            with timed('load_tracks', timings):
+                tracks, links, version = load_tracks()
+            if version == old.version:
+                old.size, old.mtime = stat.st_size, stat.st_mtime
+                return False
+            new = Dataset(*_prepare(tracks, links, version), version, stat.st_size, stat.st_mtime, timings)
+
+        # Всё строится до подмены, поэтому запросы не видят наполовину готовых данных
+        new.build_all()
+        reload_timings = timings
+        _current = new
+        return True
+
+
+register_derived('country_cube',
+                 lambda data: build_country_cube(link_frame(data.df, data.links, CUBE_COLUMNS)),
+                 append=lambda cube, new_links: merge_cubes(cube, build_country_cube(new_links)))
+# Теги - атрибут трека: строки индекса совпадают со строками канонической таблицы,
+# новые треки идут после существующих в порядке своих основных связей
+register_derived('tag_index', lambda data: TagIndex.build(data.df[TAG_COLUMN]),
+                 append=lambda index, new_links: index.append(new_links.loc[new_links['primary'], TAG_COLUMN]))
+register_derived('filter_index', lambda data: FilterIndex.build(data.df, data.links))
+# Связи каждого трека: страница трека берёт его жанры без прохода по таблице связей
+register_derived('track_links', lambda data: RowGroups(data.links['track'].to_numpy(), len(data.df)))
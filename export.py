@@ -0,0 +1,106 @@
+import json
+import os
+
+from flask import Response, jsonify, request, stream_with_context
+
+import dataset
+from filters import filtered_rows, filters_error
+from tracks import link_frame, links_of
+
+# Выгрузка строк текущей выборки страницы 1: GET /export.csv и /export.parquet
+# с параметрами country=... (можно несколько) и filters=<JSON из filter-selection>.
+# Выгрузка в формате исходного CSV - строка на пару трек-жанр; строки собираются из канонических
+# треков и связей кусками по EXPORT_CHUNK_ROWS: в памяти одновременно только текущий кусок
+# и его сериализованная копия, а не вся отфильтрованная таблица.
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('DASHBOARD_EXPORT_CHUNK_ROWS', '50000'))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Без pyarrow доступна только выгрузка в CSV
+    pa = None
+
+
+class _ChunkSink:
+    # Файлоподобный приёмник для ParquetWriter: накопленные байты забираются после каждого куска
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _rows(tracks, links):
+    return link_frame(tracks, links).drop(columns='primary')
+
+
+def _chunks(tracks, links, chunk_rows=EXPORT_CHUNK_ROWS):
+    for start in range(0, len(links), chunk_rows):
+        yield _rows(tracks, links.iloc[start:start + chunk_rows])
+
+
+def csv_stream(tracks, links):
+    yield _rows(tracks, links.iloc[:0]).to_csv(index=False).encode('utf-8')
+    for chunk in _chunks(tracks, links):
+        yield chunk.to_csv(index=False, header=False).encode('utf-8')
+
+
+def parquet_stream(tracks, links):
+    # Каждый кусок - отдельная группа строк; схема (со словарями категорий) одна на весь файл
+    schema = pa.Schema.from_pandas(_rows(tracks, links.iloc[:0]), preserve_index=False)
+    # По пустой таблице тип строковых столбцов не определить, задаём его явно
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(tracks, links):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()
+
+
+FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'parquet': (parquet_stream, 'application/vnd.apache.parquet'),
+}
+
+
+def init_app(server):
+    @server.route('/export.<fmt>')
+    def export_tracks(fmt):
+        if fmt not in FORMATS or (fmt == 'parquet' and pa is None):
+            return jsonify(error=f'unsupported format: {fmt}'), 404
+        try:
+            filters = json.loads(request.args.get('filters') or '{}')
+        except ValueError:
+            return jsonify(error='filters must be JSON'), 400
+        error = filters_error(filters)
+        if error is not None:
+            return jsonify(error=error), 400
+
+        # Версия данных фиксируется на весь ответ: перезагрузка посреди выгрузки её не меняет
+        data = dataset.current()
+        rows = filtered_rows(data, request.args.getlist('country'), filters)
+        # Фильтр по жанру оставляет у выбранных треков только связи с выбранными жанрами
+        links = links_of(data.links, rows, len(data.df), filters.get('track_genre'))
+        stream, mimetype = FORMATS[fmt]
+        return Response(stream_with_context(stream(data.df, links)), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename=tracks.{fmt}',
+            'X-Export-Rows': str(len(links)),
+        })
@@ -0,0 +1,265 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from plotly.utils import PlotlyJSONEncoder
+
+import dataset
+from filters import canonical_filters
+
+# Кэш готовых результатов callback'ов (JSON фигур и текстов карточек).
+# Ключ - нормализованные списки выбранных значений и версия датасета, поэтому
+# после перезагрузки данных старые записи перестают использоваться и удаляются.
+# В памяти процесса - LRU с ограничением по байтам; опционально SQLite-файл,
+# через который попаданиями обмениваются все воркеры сервера. Запросы к кэшу не пишут в SQLite:
+# счётчики запросов и время чтения записей копятся в памяти и сбрасываются одной транзакцией
+# раз в FLUSH_SECONDS, а любая ошибка SQLite (например, занятая другим воркером база)
+# превращается в промах кэша, а не в ошибку callback'а.
+
+MAX_BYTES = int(os.environ.get('FIGURE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+DB_PATH = os.environ.get('FIGURE_CACHE_DB')
+if not DB_PATH and os.environ.get('DASHBOARD_BACKGROUND_CALLBACKS') == '1':
+    # Фоновые callback'и выполняются в отдельных процессах, кэш в памяти сервера им не общий
+    DB_PATH = os.path.join(dataset.CACHE_DIR, 'figures.sqlite')
+DB_MAX_BYTES = int(os.environ.get('FIGURE_CACHE_DB_MAX_BYTES', 256 * 1024 * 1024))
+FLUSH_SECONDS = float(os.environ.get('FIGURE_CACHE_FLUSH_SECONDS', '10'))
+# Запись из запроса не ждёт занятую другим воркером базу дольше этого (чтение в режиме WAL не блокируется)
+WRITE_TIMEOUT = 0.5
+
+
+def normalize_selection(selected):
+    if isinstance(selected, str):
+        return selected
+    if isinstance(selected, dict):
+        return tuple(sorted((name, normalize_selection(value)) for name, value in selected.items() if value))
+    return tuple(sorted(set(selected or [])))
+
+
+class FigureCache:
+    def __init__(self, max_bytes=MAX_BYTES, db_path=DB_PATH, db_max_bytes=DB_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.db_max_bytes = db_max_bytes
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.db_errors = 0
+        # Прогрев не учитывается в статистике запросов
+        self.record_requests = True
+        self.flush_seconds = FLUSH_SECONDS
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Ещё не записанные в SQLite: число запросов по ключам и время последнего чтения записей
+        self._pending = Counter()
+        self._touched = {}
+        self._flushed = time.monotonic()
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS entries ('
+                    'key TEXT PRIMARY KEY, version TEXT, payload BLOB, '
+                    'size INTEGER, accessed REAL)'
+                )
+                # Сколько раз запрашивался каждый ключ, независимо от версии данных: по этой таблице
+                # warmup.py выбирает частые выборки для прогрева после перезапуска или перезагрузки
+                conn.execute('CREATE TABLE IF NOT EXISTS requests '
+                             '(key TEXT PRIMARY KEY, hits INTEGER, accessed REAL)')
+
+    @contextmanager
+    def _connect(self, timeout=5):
+        # Отдельное соединение на операцию: безопасно для потоков и после fork.
+        # Закрываем явно: иначе соединение живёт до сборки мусора и может попасть в дочерний процесс
+        conn = sqlite3.connect(self.db_path, timeout=timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _check_version(self, version):
+        """True, если version - версия, под которую сейчас заполняется кэш."""
+        if version == self.version:
+            return True
+        if version != dataset.live().version:
+            # Запрос, закреплённый за снимком до перезагрузки, может закончиться уже после неё:
+            # его версия не должна вытеснять записи новой ни из памяти, ни из SQLite
+            return False
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.version = version
+        if self.db_path:
+            try:
+                with self._connect(WRITE_TIMEOUT) as conn:
+                    conn.execute('DELETE FROM entries WHERE version != ?', (version,))
+            except sqlite3.Error:
+                # Записи старой версии не прочитаются (версия входит в запрос), удалит их следующий процесс
+                self.db_errors += 1
+        return True
+
+    def _remember(self, key, payload):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            if len(payload) > self.max_bytes:
+                return
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, key, version):
+        live = self._check_version(version)
+        with self._lock:
+            # Записи в памяти относятся к self.version, запрос старой версии читает только SQLite
+            payload = self._entries.get(key) if live else None
+            if payload is not None:
+                self._entries.move_to_end(key)
+            if self.record_requests and self.db_path:
+                self._pending[key] += 1
+        if payload is None and self.db_path:
+            payload = self._read_db(key, version)
+            if payload is not None and live:
+                self._remember(key, payload)
+        if time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(payload)
+
+    def _read_db(self, key, version):
+        try:
+            with self._connect() as conn:
+                row = conn.execute('SELECT payload FROM entries WHERE key = ? AND version = ?',
+                                   (key, version)).fetchone()
+        except sqlite3.Error:
+            self.db_errors += 1
+            return None
+        if row is None:
+            return None
+        with self._lock:
+            self._touched[key] = time.time()
+        return bytes(row[0])
+
+    def put(self, key, version, value):
+        live = self._check_version(version)
+        payload = json.dumps(value, cls=PlotlyJSONEncoder).encode('utf-8')
+        if not live:
+            # Результат по устаревшему снимку больше никому не нужен, а в SQLite ключ без версии
+            # заменил бы запись новой версии
+            return json.loads(payload)
+        self._remember(key, payload)
+        if self.db_path:
+            try:
+                self._write_db(key, version, payload)
+            except sqlite3.Error:
+                # Результат уже посчитан и лежит в памяти процесса, общий кэш просто его не получит
+                self.db_errors += 1
+        return json.loads(payload)
+
+    def _write_db(self, key, version, payload):
+        with self._connect(WRITE_TIMEOUT) as conn:
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                         (key, version, payload, len(payload), time.time()))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            while total > self.db_max_bytes:
+                row = conn.execute('SELECT key, size FROM entries ORDER BY accessed LIMIT 1').fetchone()
+                if row is None:
+                    break
+                conn.execute('DELETE FROM entries WHERE key = ?', (row[0],))
+                total -= row[1]
+
+    def flush(self):
+        """Записывает накопленные счётчики запросов и время чтения записей одной транзакцией."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            touched, self._touched = self._touched, {}
+            self._flushed = time.monotonic()
+        if not self.db_path or not (pending or touched):
+            return
+        now = time.time()
+        try:
+            with self._connect(WRITE_TIMEOUT) as conn:
+                conn.executemany('INSERT INTO requests VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                                 'hits = hits + excluded.hits, accessed = excluded.accessed',
+                                 [(key, hits, now) for key, hits in pending.items()])
+                conn.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                                 [(accessed, key) for key, accessed in touched.items()])
+        except sqlite3.Error:
+            self.db_errors += 1
+            with self._lock:
+                self._pending.update(pending)
+                for key, accessed in touched.items():
+                    self._touched.setdefault(key, accessed)
+
+    def forget_pending(self):
+        # В дочернем процессе: счётчики, унаследованные от родителя, запишет сам родитель
+        with self._lock:
+            self._pending.clear()
+            self._touched.clear()
+
+    def contains(self, key, version):
+        """Есть ли запись в общем SQLite-кэше (без учёта в статистике запросов)."""
+        if not self.db_path:
+            return key in self._entries and version == self.version
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM entries WHERE key = ? AND version = ?',
+                                (key, version)).fetchone() is not None
+
+    def frequent(self, limit):
+        """[(ключ, число запросов)] самых частых ключей по всем версиям данных."""
+        if not self.db_path:
+            return []
+        self.flush()
+        with self._connect() as conn:
+            return conn.execute('SELECT key, hits FROM requests ORDER BY hits DESC LIMIT ?', (limit,)).fetchall()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM entries')
+
+
+figure_cache = FigureCache()
+atexit.register(figure_cache.flush)
+
+
+def selection_key(data, namespace, selections):
+    # Словари фильтров приводятся к действующим: браузер всегда присылает полный диапазон
+    # популярности и пустые списки, и такой запрос должен совпадать с вызовом без фильтров (None)
+    return json.dumps([namespace] + [normalize_selection(canonical_filters(data, s) if isinstance(s, dict) else s)
+                                     for s in selections], ensure_ascii=False)
+
+
+def cached_by_selection(namespace):
+    # Декоратор для callback'ов, все входы которых - выбранные значения фильтров (списки или словари списков)
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*selections):
+            # Один снимок данных на весь вызов: версия ключа - та, по которой считался результат
+            with dataset.pinned(dataset.current()) as data:
+                key = selection_key(data, namespace, selections)
+                result = figure_cache.get(key, data.version)
+                if result is None:
+                    result = figure_cache.put(key, data.version, func(*selections))
+            return result
+        # Пространство имён ключей нужно прогреву (warmup.py); functools.wraps переносит его и на внешние обёртки
+        wrapper.cache_namespace = namespace
+        return wrapper
+    return decorator
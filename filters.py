@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+# Движок перекрёстных фильтров по строкам таблицы треков.
+# Для каждого значения категориального столбца заранее строится битовая маска
+# (по биту на строку, упакованы в uint64), для числовых столбцов - порядок строк
+# по возрастанию значения. Любая комбинация фильтров - это OR масок внутри столбца
+# и AND между столбцами, вместо нового булева столбца по всей таблице на каждый запрос.
+# Строки индекса - канонические треки; маска жанра отмечает треки, у которых есть связь с этим жанром.
+
+BITMAP_COLUMNS = ['country', 'track_genre', 'explicit', 'mode', 'key', 'time_signature']
+RANGE_COLUMNS = ['popularity']
+
+
+def _pack(mask):
+    # Дополняем до кратного 64 числа строк и упаковываем младшими битами вперёд
+    padded = np.zeros(-(-len(mask) // 64) * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder='little').view('<u8')
+
+
+class FilterIndex:
+    def __init__(self, bitmaps, sorted_rows, sorted_values, n_rows):
+        # bitmaps: столбец -> {значение -> маска}
+        self.bitmaps = bitmaps
+        # Для диапазонов: номера строк по возрастанию значения и сами значения в том же порядке
+        self.sorted_rows = sorted_rows
+        self.sorted_values = sorted_values
+        self.n_rows = n_rows
+        self.n_words = -(-n_rows // 64)
+
+    @classmethod
+    def build(cls, df, links=None):
+        bitmaps = {}
+        mask = np.zeros(len(df), dtype=bool)
+        for column in BITMAP_COLUMNS:
+            if column in df:
+                values, link_tracks = df[column], None
+            else:
+                # Столбец таблицы связей: позиции связей переводятся в строки их треков
+                values, link_tracks = links[column], links['track'].to_numpy()
+            codes, uniques = pd.factorize(values, sort=True)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            bitmaps[column] = {}
+            for code, value in enumerate(pd.Index(uniques).tolist()):
+                rows = order[bounds[code]:bounds[code + 1]]
+                if link_tracks is not None:
+                    rows = link_tracks[rows]
+                mask[rows] = True
+                bitmaps[column][value] = _pack(mask)
+                mask[rows] = False
+
+        sorted_rows, sorted_values = {}, {}
+        for column in RANGE_COLUMNS:
+            values = df[column].to_numpy()
+            order = np.argsort(values, kind='stable').astype(np.int32)
+            sorted_rows[column] = order
+            sorted_values[column] = values[order]
+        return cls(bitmaps, sorted_rows, sorted_values, len(df))
+
+    def values(self, column):
+        return sorted(self.bitmaps[column])
+
+    def value_range(self, column):
+        values = self.sorted_values[column]
+        return (values[0].item(), values[-1].item()) if len(values) else (0, 0)
+
+    def _empty(self):
+        return np.zeros(self.n_words, dtype='<u8')
+
+    def _values_bitmap(self, column, selected):
+        result = self._empty()
+        for value in selected:
+            bitmap = self.bitmaps[column].get(value)
+            if bitmap is not None:
+                result |= bitmap
+        return result
+
+    def _range_bitmap(self, column, low, high):
+        values = self.sorted_values[column]
+        start = np.searchsorted(values, low, side='left')
+        stop = np.searchsorted(values, high, side='right')
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.sorted_rows[column][start:stop]] = True
+        return _pack(mask)
+
+    def _is_full_range(self, column, bounds):
+        low, high = self.value_range(column)
+        return bounds[0] <= low and bounds[1] >= high
+
+    def active(self, filters):
+        """Оставляет только фильтры, которые что-то отсекают."""
+        active = {}
+        for column, selected in (filters or {}).items():
+            if column in self.bitmaps and selected:
+                active[column] = list(selected)
+            elif column in self.sorted_values and selected and not self._is_full_range(column, selected):
+                active[column] = list(selected)
+        return active
+
+    def bitmap(self, filters, rows=None):
+        """Маска строк, прошедших все фильтры; rows - дополнительный список номеров строк (например, по тегам)."""
+        result = None
+        for column, selected in self.active(filters).items():
+            if column in self.bitmaps:
+                part = self._values_bitmap(column, selected)
+            else:
+                part = self._range_bitmap(column, selected[0], selected[1])
+            result = part if result is None else np.bitwise_and(result, part, out=result)
+        if rows is not None:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[rows] = True
+            part = _pack(mask)
+            result = part if result is None else np.bitwise_and(result, part, out=result)
+        return result
+
+    def rows(self, filters, rows=None):
+        """Номера прошедших строк или None, если фильтров нет."""
+        bitmap = self.bitmap(filters, rows)
+        if bitmap is None:
+            return None
+        bits = np.unpackbits(bitmap.view(np.uint8), bitorder='little', count=self.n_rows)
+        return np.flatnonzero(bits)
+
+    def count(self, filters, rows=None):
+        bitmap = self.bitmap(filters, rows)
+        if bitmap is None:
+            return self.n_rows
+        return int(np.bitwise_count(bitmap).sum())
+
+
+# Ключи словаря фильтров, которые присылает страница 1
+FILTER_KEYS = set(BITMAP_COLUMNS) | set(RANGE_COLUMNS) | {'tags'}
+
+
+def filters_error(filters):
+    """Текст ошибки, если фильтры не того вида, что присылает страница 1 (JSON извне), иначе None."""
+    if not isinstance(filters, dict):
+        return 'filters must be a JSON object'
+    for column, selected in filters.items():
+        # Неизвестный ключ молча ничего бы не отфильтровал и отдал всю таблицу
+        if column not in FILTER_KEYS:
+            return f'unknown filter: {column}'
+        if selected is None or selected == []:
+            continue
+        if column in RANGE_COLUMNS:
+            if not (isinstance(selected, list) and len(selected) == 2
+                    and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in selected)):
+                return f'{column} must be [low, high]'
+            if selected[0] > selected[1]:
+                return f'{column} must have low <= high'
+        elif not (isinstance(selected, list) and all(isinstance(v, (str, int, float, bool)) for v in selected)):
+            return f'{column} must be a list of values'
+    return None
+
+
+def has_track_filters(data, filters):
+    # Фильтры по атрибутам треков и тегам; без них хватает предагрегатов по странам
+    filters = filters or {}
+    return bool(filters.get('tags')) or bool(data.get('filter_index').active(filters))
+
+
+def canonical_filters(data, filters):
+    """Только действующие фильтры: None, пустые списки и полный диапазон дают один и тот же {}."""
+    filters = filters or {}
+    canonical = data.get('filter_index').active(filters)
+    if filters.get('tags'):
+        canonical['tags'] = list(filters['tags'])
+    return canonical
+
+
+def filtered_rows(data, selected_countries, filters):
+    """Номера строк под всеми фильтрами (страны, атрибуты, теги) или None, если фильтров нет."""
+    filters = dict(filters or {})
+    tag_rows = data.get('tag_index').filter(filters.pop('tags', None))
+    filters['country'] = selected_countries
+    return data.get('filter_index').rows(filters, tag_rows)
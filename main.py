@@ -1,25 +1,122 @@
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
 # Имя файла
 filename = 'artists_cleaned - artists_cleaned.csv.csv'  # Замени на своё имя файла, если нужно
 
-import csv
+CHUNK_ROWS = 10000
+
+
+def clean_row(row):
+    cleaned_row = []
+    for cell in row:
+        # Удаляем пробелы вокруг каждого тега
+        tags = [tag.strip() for tag in cell.split(';')]
+        cleaned_cell = ';'.join(tags)
+        cleaned_row.append(cleaned_cell)
+    return cleaned_row
+
+
+def clean_chunk(rows):
+    return [clean_row(row) for row in rows]
+
+
+def clean_in_memory(filename):
+    # Чтение и очистка
+    rows = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter='\t')
+        for row in reader:
+            rows.append(clean_row(row))
+
+    # Сохранение обратно в файл
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerows(rows)
+    return len(rows)
+
+
+def read_chunks(reader, chunk_rows):
+    while True:
+        chunk = list(islice(reader, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+def clean_chunks_parallel(chunks, workers):
+    # Держим в работе не больше 2 чанков на процесс, чтобы память оставалась ограниченной,
+    # и отдаём результаты в исходном порядке
+    with Pool(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(clean_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def clean_streaming(filename, chunk_rows=CHUNK_ROWS, workers=1):
+    # Пишем во временный файл рядом с исходным и атомарно подменяем его,
+    # поэтому при падении процесса исходный файл остаётся целым
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.cleaning-', suffix='.tmp')
+    row_count = 0
+    try:
+        with open(filename, 'r', encoding='utf-8', newline='') as src, \
+                os.fdopen(fd, 'w', encoding='utf-8', newline='') as dst:
+            reader = csv.reader(src, delimiter='\t')
+            writer = csv.writer(dst, delimiter='\t')
+            chunks = read_chunks(reader, chunk_rows)
+            if workers > 1:
+                cleaned = clean_chunks_parallel(chunks, workers)
+            else:
+                cleaned = (clean_chunk(chunk) for chunk in chunks)
+            for chunk in cleaned:
+                writer.writerows(chunk)
+                row_count += len(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copymode(filename, tmp_path)
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Удаление лишних пробелов вокруг тегов в TSV-файле')
+    parser.add_argument('filename', nargs='?', default=filename)
+    parser.add_argument('--stream', action='store_true',
+                        help='потоковая обработка по чанкам с атомарной заменой файла')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='количество строк в одном чанке')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='количество процессов для потоковой обработки')
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.filename)
+    start = time.perf_counter()
+    if args.stream or args.workers > 1:
+        row_count = clean_streaming(args.filename, args.chunk_rows, args.workers)
+    else:
+        row_count = clean_in_memory(args.filename)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print("Лишние пробелы удалены и файл успешно сохранён.")
+    print(f"Строк: {row_count} ({row_count / elapsed:.0f} строк/с), "
+          f"байт: {size} ({size / elapsed / 1024 / 1024:.2f} МБ/с), время: {elapsed:.2f} с")
 
 
-# Чтение и очистка
-rows = []
-with open(filename, 'r', encoding='utf-8') as f:
-    reader = csv.reader(f, delimiter='\t')
-    for row in reader:
-        cleaned_row = []
-        for cell in row:
-            # Удаляем пробелы вокруг каждого тега
-            tags = [tag.strip() for tag in cell.split(';')]
-            cleaned_cell = ';'.join(tags)
-            cleaned_row.append(cleaned_cell)
-        rows.append(cleaned_row)
-
-# Сохранение обратно в файл
-with open(filename, 'w', encoding='utf-8', newline='') as f:
-    writer = csv.writer(f, delimiter='\t')
-    writer.writerows(rows)
-
-print("Лишние пробелы удалены и файл успешно сохранён.")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, g, has_request_context, request
+
+# Замеры времени callback'ов по фазам (фильтрация, агрегация, построение фигур,
+# сериализация) в виде гистограмм. Отдаются в формате Prometheus на /metrics,
+# а для запросов _dash-update-component дублируются в заголовке Server-Timing.
+
+METRICS_ENABLED = os.environ.get('DASHBOARD_METRICS', '1') != '0'
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+UPDATE_PATH = '/_dash-update-component'
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, callback_name, phase_name, seconds):
+        key = (callback_name, phase_name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self):
+        lines = [
+            '# HELP dash_callback_duration_seconds Duration of Dash callback phases.',
+            '# TYPE dash_callback_duration_seconds histogram',
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            snapshot = [(key, list(h.counts), h.total, h.count) for key, h in items]
+        for (callback_name, phase_name), counts, total, count in snapshot:
+            labels = f'callback="{callback_name}",phase="{phase_name}"'
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'dash_callback_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'dash_callback_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'dash_callback_duration_seconds_sum{{{labels}}} {total}')
+            lines.append(f'dash_callback_duration_seconds_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+# Дополнительные источники метрик: функции, возвращающие строки в формате Prometheus
+collectors = []
+# Фоновые задачи Dash выполняются в отдельных процессах, их реестр серверу не виден.
+# job_reporter(callback, [(фаза, секунды)]) вызывается в процессе задачи по окончании callback'а,
+# job_timings(job) -> (callback, фазы) или None - в сервере на запросе результата задачи
+job_reporter = None
+job_timings = None
+# output_observer(результат callback'а) вызывается в запросе до сериализации ответа (см. serialization)
+output_observer = None
+_local = threading.local()
+
+
+def _in_request():
+    # В процессе фоновой задачи контекст запроса скопирован из сервера, но ответа этого запроса уже нет
+    return job_reporter is None and has_request_context()
+
+
+def _current_callback():
+    if _in_request():
+        return getattr(g, 'metrics_callback', None)
+    return getattr(_local, 'callback', None)
+
+
+def _record(phase_name, seconds):
+    callback_name = _current_callback()
+    if callback_name is None:
+        return
+    registry.observe(callback_name, phase_name, seconds)
+    if _in_request():
+        g.metrics_phases.append((phase_name, seconds))
+    else:
+        _local.phases.append((phase_name, seconds))
+
+
+@contextmanager
+def phase(name):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def _observed(result):
+    if output_observer is not None and _in_request():
+        output_observer(result)
+    return result
+
+
+def instrumented(name):
+    # Декоратор callback'а: всё, что внутри замеряется через phase(), относится к нему
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return _observed(func(*args, **kwargs))
+            if _in_request():
+                g.metrics_callback = name
+                g.metrics_phases = []
+            else:
+                _local.callback = name
+                _local.phases = []
+            start = time.perf_counter()
+            try:
+                return _observed(func(*args, **kwargs))
+            finally:
+                _record('callback', time.perf_counter() - start)
+                if not _in_request():
+                    _local.callback = None
+                    if job_reporter is not None:
+                        job_reporter(name, _local.phases)
+        return wrapper
+    return decorator
+
+
+def init_app(server):
+    if not METRICS_ENABLED:
+        return
+
+    @server.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def add_server_timing(response):
+        callback_name = getattr(g, 'metrics_callback', None)
+        if request.path == UPDATE_PATH and callback_name is None and request.args.get('job'):
+            return add_job_timing(response)
+        if request.path != UPDATE_PATH or callback_name is None:
+            return response
+        total = time.perf_counter() - g.metrics_start
+        phases = g.metrics_phases
+        callback_time = sum(seconds for phase_name, seconds in phases if phase_name == 'callback')
+        # Всё, что не ушло на сам callback - разбор запроса и сериализация ответа
+        registry.observe(callback_name, 'serialize', total - callback_time)
+        registry.observe(callback_name, 'total', total)
+        timings = phases + [('serialize', total - callback_time), ('total', total)]
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase_name};dur={seconds * 1000:.2f}' for phase_name, seconds in timings
+        )
+        return response
+
+    def add_job_timing(response):
+        # Запрос результата фоновой задачи: фазы пришли из процесса задачи
+        collected = job_timings(request.args['job']) if job_timings is not None else None
+        if collected is None:
+            return response
+        callback_name, phases = collected
+        for phase_name, seconds in phases:
+            registry.observe(callback_name, phase_name, seconds)
+        poll = time.perf_counter() - g.metrics_start
+        registry.observe(callback_name, 'poll', poll)
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase_name};dur={seconds * 1000:.2f}' for phase_name, seconds in phases + [('poll', poll)]
+        )
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        extra = ''.join(line + '\n' for collect in collectors for line in collect())
+        return Response(registry.render() + extra, mimetype='text/plain; version=0.0.4')
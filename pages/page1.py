@@ -1,17 +1,34 @@
+import os
+
 import dash
-from dash import html, callback, Output, Input, dcc
-import pandas as pd
+from dash import html, callback, clientside_callback, Output, Input, State, dcc, Patch
 import plotly.express as px
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
+import numpy as np
+
+from aggregates import (CUBE_COLUMNS, HEATMAP_COLUMNS, bin_centers, binned_counts, build_country_cube,
+                        cube_payload, feature_ranges, query_cube)
+from background import callback_options, debounced
+import dataset
+from figure_cache import cached_by_selection
+from filters import filtered_rows, has_track_filters
+from metrics import instrumented, phase
+from quantiles import QUANTILES, QuantileSketches, exact_quantiles
+from serialization import encode_array, round_value
+from tracks import link_frame, links_of
 
 dash.register_page(__name__, path="/", name="Страница 1")
 
-# Загрузка данных
-df = pd.read_csv("cleaned_dat.csv")
-df['explicit'] = df['explicit'].fillna(False)
+# Режим фильтрации в браузере: агрегаты по странам и гистограммы квантильных скетчей один раз
+# уходят в dcc.Store, а графики и карточки (в том числе квантили) пересчитываются клиентскими
+# callback'ами без запросов к серверу. Тепловая карта остаётся на сервере: ей нужны сами строки,
+# поэтому смена стран в этом режиме по-прежнему запрашивает только её
+CLIENTSIDE_FILTERING = os.environ.get('DASHBOARD_CLIENTSIDE_FILTERING') == '1'
 
-all_countries = df['country'].unique()
+# Квантили по выборкам не больше этого числа строк считаются точно, по остальным - по скетчам
+EXACT_QUANTILE_ROWS = int(os.environ.get('DASHBOARD_EXACT_QUANTILE_ROWS', '100000'))
+QUANTILE_COLUMNS = ['duration_ms', 'popularity']
 
 
 def ms_to_min_sec(duration_ms):
@@ -20,210 +37,21 @@ def ms_to_min_sec(duration_ms):
     return f"{minutes}:{seconds:02d}"
 
 
-def categorize_tempo(tempo):
-    if tempo < 80:
-        return "Медленный (0-80)"
-    elif 80 <= tempo < 110:
-        return "Средний (80-110)"
-    else:
-        return "Быстрый (110+)"
-
-
-layout = dbc.Container([
-
-    # Фильтры
-    html.Div(
-        dbc.Row([
-            dbc.Col([
-                dbc.Label('Страна исполнителя', style={'fontWeight': 'bold', 'color': 'white'}),
-                dcc.Dropdown(
-                    id='country-filter',
-                    options=[{'label': i, 'value': i} for i in all_countries],
-                    value=[],
-                    multi=True,
-                    placeholder="Все страны",
-                    style={
-                        'backgroundColor': '#595959',
-                        'borderRadius': '20px',
-                        'color': 'black',
-                        'fontSize': '16px'
-                    }
-                )
-            ], width=12)
-        ]),
-        style={
-            'width': '100%',
-            'borderRadius': '45px',
-            'backgroundColor': '#242424',
-            'padding': '25px',
-            'marginBottom': '30px'
-        }
-    ),
-
-    # Графики и карточки
-    dbc.Row([
-        # Левый график (жанры по популярности)
-        dbc.Col(
-            html.Div([
-                html.H4("Популярность жанров", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold'
-                }),
-                dcc.Graph(id='genre-popularity-chart', style={'height': '70vh'})
-            ],
-                style={
-                    'borderRadius': '45px',
-                    'backgroundColor': '#242424',
-                    'padding': '25px'
-                }),
-            width=6
-        ),
-
-        # Центральная колонка с графиками
-        dbc.Col([
-            html.Div([
-                html.H4("Доля треков с explicit-контентом", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold'
-                }),
-                dcc.Graph(id='explicit-progress', style={'height': '30vh'})
-            ],
-                style={
-                    'borderRadius': '45px',
-                    'backgroundColor': '#242424',
-                    'padding': '25px',
-                    'marginBottom': '20px'
-                }),
+def tempo_distribution(summary):
+    tempo_counts = summary['tempo_counts']
+    tempo_counts = tempo_counts[tempo_counts > 0].sort_values(ascending=False)
+    tempo_dist = (tempo_counts / tempo_counts.sum()).reset_index()
+    tempo_dist.columns = ['Tempo', 'Percentage']
+    tempo_dist['Percentage'] = tempo_dist['Percentage'] * 100
+    return tempo_dist
 
-            html.Div([
-                html.H4("Распределение темпа треков", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold'
-                }),
-                dcc.Graph(id='tempo-distribution-chart', style={'height': '30vh'})
-            ],
-                style={
-                    'borderRadius': '45px',
-                    'backgroundColor': '#242424',
-                    'padding': '25px'
-                })
-        ], width=3),
 
-        # Правая колонка с карточками
-        dbc.Col(
-            html.Div([
-                html.H4("Метрики треков", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold'
-                }),
-                # Карточка "Самый короткий трек"
-                html.Div([
-                    html.Div("Самый короткий трек", style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontSize': '16px',
-                        'marginBottom': '8px'
-                    }),
-                    html.Div(id='shortest-track', style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontWeight': 'bold',
-                        'fontSize': '24px'
-                    })
-                ], style={
-                    'padding': '20px',
-                    'marginBottom': '20px',
-                    'height': '20vh',
-                    'display': 'flex',
-                    'flexDirection': 'column',
-                    'justifyContent': 'center'
-                }),
+def top_genres(summary):
+    genre_stats = summary['genre_popularity'].reset_index()
+    return genre_stats.sort_values('popularity', ascending=False).head(10)
 
-                # Карточка "Средняя продолжительность трека"
-                html.Div([
-                    html.Div("Средняя продолжительность трека", style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontSize': '16px',
-                        'marginBottom': '8px'
-                    }),
-                    html.Div(id='avg-track', style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontWeight': 'bold',
-                        'fontSize': '24px'
-                    })
-                ], style={
-                    'padding': '20px',
-                    'marginBottom': '20px',
-                    'height': '20vh',
-                    'display': 'flex',
-                    'flexDirection': 'column',
-                    'justifyContent': 'center'
-                }),
 
-                # Карточка "Самый длинный трек"
-                html.Div([
-                    html.Div("Самый длинный трек", style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontSize': '16px',
-                        'marginBottom': '8px'
-                    }),
-                    html.Div(id='longest-track', style={
-                        'textAlign': 'left',
-                        'color': 'white',
-                        'fontWeight': 'bold',
-                        'fontSize': '24px'
-                    })
-                ], style={
-                    'padding': '20px',
-                    'height': '20vh',
-                    'display': 'flex',
-                    'flexDirection': 'column',
-                    'justifyContent': 'center'
-                })
-            ], style={
-                'borderRadius': '45px',
-                'backgroundColor': '#242424',
-                'padding': '25px',
-                'width': '100%'
-            }),
-            width=3
-        )
-    ])
-], fluid=True, style={
-    'padding': '20px',
-    'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
-    'fontFamily': 'Inter',
-    'minHeight': '100vh'
-})
-
-@callback(
-    [Output('genre-popularity-chart', 'figure'),
-     Output('explicit-progress', 'figure'),
-     Output('tempo-distribution-chart', 'figure'),
-     Output('shortest-track', 'children'),
-     Output('avg-track', 'children'),
-     Output('longest-track', 'children')],
-    [Input('country-filter', 'value')]
-)
-def update_all_charts(selected_countries):
-    filtered_data = df.copy()
-    if selected_countries:
-        filtered_data = filtered_data[filtered_data['country'].isin(selected_countries)]
-
-    # График 1: Топ жанров по популярности
-    genre_stats = filtered_data.groupby('track_genre')['popularity'].mean().reset_index()
-    genre_stats = genre_stats.sort_values('popularity', ascending=False).head(10)
+def make_genre_figure(genre_stats):
     genre_fig = px.bar(
         genre_stats,
         x='track_genre',
@@ -248,9 +76,10 @@ def update_all_charts(selected_countries):
         yaxis_title="Средняя популярность",
         xaxis_title="Жанр"
     )
+    return genre_fig
 
-    # График 2: Доля треков без explicit
-    non_explicit_percent = (1 - filtered_data['explicit'].mean()) * 100
+
+def make_gauge_figure(non_explicit_percent):
     gauge_fig = go.Figure(go.Indicator(
         mode="gauge+number",
         value=non_explicit_percent,
@@ -287,14 +116,10 @@ def update_all_charts(selected_countries):
             )
         ]
     )
+    return gauge_fig
 
-    # График 3: Распределение темпов
-    tempo_data = filtered_data.copy()
-    tempo_data['tempo_category'] = tempo_data['tempo'].apply(categorize_tempo)
-    tempo_dist = tempo_data['tempo_category'].value_counts(normalize=True).reset_index()
-    tempo_dist.columns = ['Tempo', 'Percentage']
-    tempo_dist['Percentage'] = tempo_dist['Percentage'] * 100
 
+def make_tempo_figure(tempo_dist):
     donut_fig = px.pie(
         tempo_dist,
         values='Percentage',
@@ -302,8 +127,6 @@ def update_all_charts(selected_countries):
         hole=0.5,
         color_discrete_sequence=['#64BDC6', '#D9B4A6', '#C3DAA7']
     )
-    # В функции update_all_charts в page1.py измените код для donut_fig:
-
     donut_fig.update_layout(
         plot_bgcolor='rgba(0,0,0,0)',
         paper_bgcolor='rgba(0,0,0,0)',
@@ -330,10 +153,711 @@ def update_all_charts(selected_countries):
         marker=dict(line=dict(color='#242424', width=2)),
         opacity=0.9  # Небольшая прозрачность
     )
+    return donut_fig
+
+
+FEATURE_LABELS = {
+    'danceability': 'Танцевальность',
+    'energy': 'Энергичность',
+    'loudness': 'Громкость, дБ',
+    'speechiness': 'Речь',
+    'acousticness': 'Акустичность',
+    'instrumentalness': 'Инструментальность',
+    'liveness': 'Живое исполнение',
+    'valence': 'Позитивность',
+    'tempo': 'Темп, BPM',
+    'popularity': 'Популярность',
+    'duration_ms': 'Длительность, мс',
+}
+
+
+def feature_options():
+    return [{'label': FEATURE_LABELS[column], 'value': column} for column in HEATMAP_COLUMNS]
+
+
+def make_heatmap_figure():
+    heatmap_fig = go.Figure(go.Heatmap(
+        z=[], x=[], y=[],
+        colorscale=[[0, '#242424'], [0.05, '#22919D'], [1, '#D2F2EF']],
+        hovertemplate='x: %{x:.3g}<br>y: %{y:.3g}<br>треков: %{z}<extra></extra>',
+        colorbar=dict(title='Треков', title_font=dict(color='white'), tickfont=dict(color='white'))
+    ))
+    heatmap_fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font_color='white',
+        margin=dict(l=20, r=20, t=20, b=20),
+        xaxis=dict(showgrid=False),
+        yaxis=dict(showgrid=False)
+    )
+    return heatmap_fig
+
+
+def build_skeletons(data):
+    # Каркасы фигур строятся один раз по всем странам; callback присылает только новые данные
+    summary = query_cube(data.get('country_cube'), [])
+    return {
+        'genre': make_genre_figure(top_genres(summary)),
+        'gauge': make_gauge_figure((1 - summary['explicit_share']) * 100),
+        'tempo': make_tempo_figure(tempo_distribution(summary)),
+    }
+
+
+dataset.register_derived('page1_skeletons', build_skeletons)
+dataset.register_derived('feature_ranges', lambda data: feature_ranges(data.df))
+# Список стран для выпадающего списка берётся из индекса куба, а не из прохода по таблице на каждый показ
+dataset.register_derived(
+    'country_options',
+    lambda data: sorted(data.get('country_cube').index.get_level_values('country').unique().astype(str)))
+dataset.register_derived(
+    'quantile_sketches',
+    lambda data: {column: QuantileSketches.build(data.df, column) for column in QUANTILE_COLUMNS},
+    append=lambda sketches, new_links: {
+        column: sketch.merge(QuantileSketches.build(new_links[new_links['primary']], column))
+        for column, sketch in sketches.items()})
+
+
+KEY_NAMES = ['C', 'C♯/D♭', 'D', 'D♯/E♭', 'E', 'F', 'F♯/G♭', 'G', 'G♯/A♭', 'A', 'A♯/B♭', 'B']
+MODE_NAMES = {0: 'Минор', 1: 'Мажор'}
+EXPLICIT_NAMES = {False: 'Без explicit', True: 'Explicit'}
+
+
+def filter_dropdown(component_id, label, options, placeholder, width):
+    return dbc.Col([
+        dbc.Label(label, style={'fontWeight': 'bold', 'color': 'white'}),
+        dcc.Dropdown(
+            id=component_id,
+            options=options,
+            value=[],
+            multi=True,
+            placeholder=placeholder,
+            style={
+                'backgroundColor': '#595959',
+                'borderRadius': '20px',
+                'color': 'black',
+                'fontSize': '16px'
+            }
+        )
+    ], width=width)
+
+
+def tag_filter_columns(data):
+    # Фильтры по тегам и атрибутам треков работают через индексы на сервере, в клиентском режиме их нет
+    if CLIENTSIDE_FILTERING:
+        return []
+    tag_counts = data.get('tag_index').counts()
+    return [filter_dropdown('tag-filter', 'Теги Last.fm',
+                            [{'label': f'{tag} ({count})', 'value': tag} for tag, count in tag_counts.items()],
+                            "Все теги", 6)]
+
+
+def track_filter_rows(data):
+    if CLIENTSIDE_FILTERING:
+        return []
+    filter_index = data.get('filter_index')
+    low, high = filter_index.value_range('popularity')
+    return [
+        dbc.Row([
+            filter_dropdown('genre-filter', 'Жанр',
+                            [{'label': g, 'value': g} for g in filter_index.values('track_genre')],
+                            "Все жанры", 4),
+            filter_dropdown('explicit-filter', 'Explicit',
+                            [{'label': EXPLICIT_NAMES[v], 'value': v} for v in filter_index.values('explicit')],
+                            "Все", 2),
+            filter_dropdown('mode-filter', 'Лад',
+                            [{'label': MODE_NAMES.get(v, v), 'value': v} for v in filter_index.values('mode')],
+                            "Все", 2),
+            filter_dropdown('key-filter', 'Тональность',
+                            [{'label': KEY_NAMES[v] if 0 <= v < 12 else v, 'value': v}
+                             for v in filter_index.values('key')],
+                            "Все", 2),
+            filter_dropdown('time-signature-filter', 'Размер',
+                            [{'label': f'{v}/4', 'value': v} for v in filter_index.values('time_signature')],
+                            "Все", 2),
+        ], style={'marginTop': '15px'}),
+        dbc.Row([
+            dbc.Col([
+                dbc.Label('Популярность', style={'fontWeight': 'bold', 'color': 'white'}),
+                dcc.RangeSlider(id='popularity-filter', min=low, max=high, value=[low, high],
+                                step=1, allowCross=False, tooltip={'placement': 'bottom'})
+            ], width=12)
+        ], style={'marginTop': '15px'}),
+    ]
+
+
+def quantile_card(title, component_id):
+    return html.Div([
+        html.H4(title, style={
+            'textAlign': 'center',
+            'color': 'white',
+            'marginBottom': '10px',
+            'fontWeight': 'bold'
+        }),
+        html.Div(" · ".join(quantile_labels()), style={
+            'textAlign': 'center',
+            'color': 'lightgray',
+            'fontSize': '16px'
+        }),
+        html.Div(id=component_id, style={
+            'textAlign': 'center',
+            'color': 'white',
+            'fontWeight': 'bold',
+            'fontSize': '24px'
+        })
+    ], style={
+        'borderRadius': '45px',
+        'backgroundColor': '#242424',
+        'padding': '25px'
+    })
+
+
+def quantile_labels():
+    return ["медиана" if q == 0.5 else f"p{round(q * 100)}" for q in QUANTILES]
+
+
+def layout(**kwargs):
+    # Макет строится при открытии страницы, поэтому импорт модуля не трогает данные
+    data = dataset.current()
+    skeletons = data.get('page1_skeletons')
+    all_countries = data.get('country_options')
+
+    page = dbc.Container([
+
+        # Фильтры
+        html.Div([
+            dbc.Row([
+                dbc.Col([
+                    dbc.Label('Страна исполнителя', style={'fontWeight': 'bold', 'color': 'white'}),
+                    dcc.Dropdown(
+                        id='country-filter',
+                        options=[{'label': i, 'value': i} for i in all_countries],
+                        value=[],
+                        multi=True,
+                        placeholder="Все страны",
+                        style={
+                            'backgroundColor': '#595959',
+                            'borderRadius': '20px',
+                            'color': 'black',
+                            'fontSize': '16px'
+                        }
+                    )
+                ], width=12 if CLIENTSIDE_FILTERING else 6),
+                *tag_filter_columns(data)
+            ]),
+            *track_filter_rows(data),
+            # Выгрузка строк текущей выборки; ссылки собираются из общих Store на клиенте
+            html.Div([
+                html.A("Скачать CSV", id='export-csv', href='/export.csv', style={'color': '#9FD5D7'}),
+                html.A("Скачать Parquet", id='export-parquet', href='/export.parquet',
+                       style={'color': '#9FD5D7', 'marginLeft': '20px'}),
+            ], style={'marginTop': '15px'})
+        ],
+            style={
+                'width': '100%',
+                'borderRadius': '45px',
+                'backgroundColor': '#242424',
+                'padding': '25px',
+                'marginBottom': '30px'
+            }
+        ),
+
+        # Графики и карточки
+        dbc.Row([
+            # Левый график (жанры по популярности)
+            dbc.Col(
+                html.Div([
+                    html.H4("Популярность жанров", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    dcc.Graph(id='genre-popularity-chart', figure=skeletons['genre'], style={'height': '70vh'})
+                ],
+                    style={
+                        'borderRadius': '45px',
+                        'backgroundColor': '#242424',
+                        'padding': '25px'
+                    }),
+                width=6
+            ),
+
+            # Центральная колонка с графиками
+            dbc.Col([
+                html.Div([
+                    html.H4("Доля треков с explicit-контентом", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    dcc.Graph(id='explicit-progress', figure=skeletons['gauge'], style={'height': '30vh'})
+                ],
+                    style={
+                        'borderRadius': '45px',
+                        'backgroundColor': '#242424',
+                        'padding': '25px',
+                        'marginBottom': '20px'
+                    }),
+
+                html.Div([
+                    html.H4("Распределение темпа треков", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    dcc.Graph(id='tempo-distribution-chart', figure=skeletons['tempo'], style={'height': '30vh'})
+                ],
+                    style={
+                        'borderRadius': '45px',
+                        'backgroundColor': '#242424',
+                        'padding': '25px'
+                    })
+            ], width=3),
+
+            # Правая колонка с карточками
+            dbc.Col(
+                html.Div([
+                    html.H4("Метрики треков", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    # Карточка "Самый короткий трек"
+                    html.Div([
+                        html.Div("Самый короткий трек", style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontSize': '16px',
+                            'marginBottom': '8px'
+                        }),
+                        html.Div(id='shortest-track', style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontWeight': 'bold',
+                            'fontSize': '24px'
+                        })
+                    ], style={
+                        'padding': '20px',
+                        'marginBottom': '20px',
+                        'height': '20vh',
+                        'display': 'flex',
+                        'flexDirection': 'column',
+                        'justifyContent': 'center'
+                    }),
+
+                    # Карточка "Средняя продолжительность трека"
+                    html.Div([
+                        html.Div("Средняя продолжительность трека", style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontSize': '16px',
+                            'marginBottom': '8px'
+                        }),
+                        html.Div(id='avg-track', style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontWeight': 'bold',
+                            'fontSize': '24px'
+                        })
+                    ], style={
+                        'padding': '20px',
+                        'marginBottom': '20px',
+                        'height': '20vh',
+                        'display': 'flex',
+                        'flexDirection': 'column',
+                        'justifyContent': 'center'
+                    }),
+
+                    # Карточка "Самый длинный трек"
+                    html.Div([
+                        html.Div("Самый длинный трек", style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontSize': '16px',
+                            'marginBottom': '8px'
+                        }),
+                        html.Div(id='longest-track', style={
+                            'textAlign': 'left',
+                            'color': 'white',
+                            'fontWeight': 'bold',
+                            'fontSize': '24px'
+                        })
+                    ], style={
+                        'padding': '20px',
+                        'height': '20vh',
+                        'display': 'flex',
+                        'flexDirection': 'column',
+                        'justifyContent': 'center'
+                    })
+                ], style={
+                    'borderRadius': '45px',
+                    'backgroundColor': '#242424',
+                    'padding': '25px',
+                    'width': '100%'
+                }),
+                width=3
+            )
+        ]),
+
+        # Медиана, p90 и p99 длительности и популярности
+        dbc.Row([
+            dbc.Col(quantile_card("Длительность трека", 'duration-quantiles'), width=6),
+            dbc.Col(quantile_card("Популярность трека", 'popularity-quantiles'), width=6),
+        ], style={'marginTop': '20px'}),
+
+        # Тепловая карта двух аудио-характеристик
+        dbc.Row([
+            dbc.Col(
+                html.Div([
+                    html.H4("Связь аудио-характеристик", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    dbc.Row([
+                        dbc.Col(dcc.Dropdown(id='heatmap-x', options=feature_options(), value='energy',
+                                             clearable=False, style={'color': 'black'}), width=3),
+                        dbc.Col(dcc.Dropdown(id='heatmap-y', options=feature_options(), value='valence',
+                                             clearable=False, style={'color': 'black'}), width=3),
+                    ], justify='center', style={'marginBottom': '10px'}),
+                    dcc.Graph(id='feature-heatmap', figure=make_heatmap_figure(), style={'height': '60vh'})
+                ],
+                    style={
+                        'borderRadius': '45px',
+                        'backgroundColor': '#242424',
+                        'padding': '25px'
+                    }),
+                width=12
+            )
+        ], style={'marginTop': '20px'})
+    ], fluid=True, style={
+        'padding': '20px',
+        'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
+        'fontFamily': 'Inter',
+        'minHeight': '100vh'
+    })
+
+    if CLIENTSIDE_FILTERING:
+        page.children.append(dcc.Store(id='country-cube-store', data=data.get('country_cube_payload')))
+        page.children.append(dcc.Store(id='quantile-sketch-store', data=data.get('quantile_payload')))
+    return page
+
+
+chart_outputs = [
+    Output('genre-popularity-chart', 'figure'),
+    Output('explicit-progress', 'figure'),
+    Output('tempo-distribution-chart', 'figure'),
+    Output('shortest-track', 'children'),
+    Output('avg-track', 'children'),
+    Output('longest-track', 'children')
+]
+
+if CLIENTSIDE_FILTERING:
+    dataset.register_derived('country_cube_payload', lambda data: cube_payload(data.get('country_cube')))
+    dataset.register_derived('quantile_payload', lambda data: {
+        'quantiles': QUANTILES,
+        'columns': {column: sketch.payload() for column, sketch in data.get('quantile_sketches').items()},
+    })
+
+
+@instrumented('update_all_charts')
+@cached_by_selection('page1')
+def update_all_charts(selected_countries, filters=None):
+    # Если выбраны только страны, все показатели собираются из предагрегированного куба,
+    # без прохода по строкам. Иначе куб строится по связям треков, отобранных битовыми масками,
+    # с выбранными жанрами
+    data = dataset.current()
+    with phase('filter'):
+        links = None
+        if has_track_filters(data, filters):
+            rows = filtered_rows(data, selected_countries, filters)
+            links = links_of(data.links, rows, len(data.df), (filters or {}).get('track_genre'))
+
+    with phase('aggregate'):
+        if links is None:
+            summary = query_cube(data.get('country_cube'), selected_countries)
+        else:
+            summary = query_cube(build_country_cube(link_frame(data.df, links, CUBE_COLUMNS)), [])
+        genre_stats = top_genres(summary)
+        tempo_dist = tempo_distribution(summary)
+
+    with phase('figure'):
+        return build_chart_updates(summary, genre_stats, tempo_dist)
+
+
+def build_chart_updates(summary, genre_stats, tempo_dist):
+    # График 1: Топ жанров по популярности
+    genre_patch = Patch()
+    genre_patch['data'][0]['x'] = genre_stats['track_genre'].tolist()
+    genre_patch['data'][0]['y'] = encode_array(genre_stats['popularity'])
+
+    # График 2: Доля треков без explicit
+    gauge_patch = Patch()
+    gauge_patch['data'][0]['value'] = round_value((1 - summary['explicit_share']) * 100)
+
+    # График 3: Распределение темпов
+    tempo_patch = Patch()
+    tempo_patch['data'][0]['labels'] = tempo_dist['Tempo'].tolist()
+    tempo_patch['data'][0]['values'] = encode_array(tempo_dist['Percentage'])
 
     # Карточки с длительностью треков
-    shortest = ms_to_min_sec(filtered_data['duration_ms'].min()) if not filtered_data.empty else "0:00"
-    avg = ms_to_min_sec(filtered_data['duration_ms'].mean()) if not filtered_data.empty else "0:00"
-    longest = ms_to_min_sec(filtered_data['duration_ms'].max()) if not filtered_data.empty else "0:00"
+    has_tracks = summary['track_count'] > 0
+    shortest = ms_to_min_sec(summary['dur_min']) if has_tracks else "0:00"
+    avg = ms_to_min_sec(summary['dur_mean']) if has_tracks else "0:00"
+    longest = ms_to_min_sec(summary['dur_max']) if has_tracks else "0:00"
 
-    return genre_fig, gauge_fig, donut_fig, shortest, avg, longest
\ No newline at end of file
+    return genre_patch, gauge_patch, tempo_patch, shortest, avg, longest
+
+
+# Выбор стран сохраняется в общий Store, из которого его читают callback'и страниц 1 и 2;
+# быстрые последовательные изменения схлопываются в одно
+clientside_callback(
+    debounced("""
+    function(selected) {
+        return selected || [];
+    }
+    """, 'country-selection'),
+    Output('country-selection', 'data'),
+    Input('country-filter', 'value')
+)
+
+if CLIENTSIDE_FILTERING:
+    clientside_callback(
+        """
+        function(selected, cube, genreFig, gaugeFig, tempoFig) {
+            const chosen = new Set(selected || []);
+            const useAll = chosen.size === 0;
+            const popSum = {}, popCount = {};
+            let tracks = 0, explicit = 0, durSum = 0, durCount = 0;
+            let durMin = Infinity, durMax = -Infinity;
+            const tempo = [0, 0, 0];
+
+            // Складываем частичные агрегаты выбранных стран
+            for (let i = 0; i < cube.country.length; i++) {
+                if (!useAll && !chosen.has(cube.countries[cube.country[i]])) {
+                    continue;
+                }
+                const genre = cube.genres[cube.genre[i]];
+                popSum[genre] = (popSum[genre] || 0) + cube.pop_sum[i];
+                popCount[genre] = (popCount[genre] || 0) + cube.pop_count[i];
+                tracks += cube.track_count[i];
+                explicit += cube.explicit_count[i];
+                tempo[0] += cube.tempo_slow[i];
+                tempo[1] += cube.tempo_mid[i];
+                tempo[2] += cube.tempo_fast[i];
+                // Длительность есть только у групп с основными связями треков
+                if (cube.dur_count[i]) {
+                    durSum += cube.dur_sum[i];
+                    durCount += cube.dur_count[i];
+                    durMin = Math.min(durMin, cube.dur_min[i]);
+                    durMax = Math.max(durMax, cube.dur_max[i]);
+                }
+            }
+
+            const genres = Object.keys(popSum)
+                .map(g => [g, popSum[g] / popCount[g]])
+                .sort((a, b) => b[1] - a[1])
+                .slice(0, 10);
+            const tempoDist = cube.tempo_labels
+                .map((label, i) => [label, tempo[i]])
+                .filter(item => item[1] > 0)
+                .sort((a, b) => b[1] - a[1]);
+            const tempoTotal = tempoDist.reduce((sum, item) => sum + item[1], 0);
+
+            const withData = (fig, data) => Object.assign({}, fig, {
+                data: [Object.assign({}, fig.data[0], data)]
+            });
+            const minSec = ms => {
+                const seconds = Math.floor((ms / 1000) % 60);
+                const minutes = Math.floor((ms / 60000) % 60);
+                return minutes + ':' + String(seconds).padStart(2, '0');
+            };
+
+            return [
+                withData(genreFig, {x: genres.map(g => g[0]), y: genres.map(g => g[1])}),
+                withData(gaugeFig, {value: tracks ? (1 - explicit / tracks) * 100 : null}),
+                withData(tempoFig, {
+                    labels: tempoDist.map(t => t[0]),
+                    values: tempoDist.map(t => t[1] / tempoTotal * 100)
+                }),
+                durCount ? minSec(durMin) : '0:00',
+                durCount ? minSec(durSum / durCount) : '0:00',
+                durCount ? minSec(durMax) : '0:00'
+            ];
+        }
+        """,
+        chart_outputs,
+        Input('country-filter', 'value'),
+        State('country-cube-store', 'data'),
+        State('genre-popularity-chart', 'figure'),
+        State('explicit-progress', 'figure'),
+        State('tempo-distribution-chart', 'figure')
+    )
+else:
+    # Значения всех фильтров, кроме стран, собираются в общий Store, из которого их читает и страница 2
+    clientside_callback(
+        debounced("""
+        function(tags, genres, explicit, mode, key, timeSignature, popularity) {
+            return {
+                tags: tags || [],
+                track_genre: genres || [],
+                explicit: explicit || [],
+                mode: mode || [],
+                key: key || [],
+                time_signature: timeSignature || [],
+                popularity: popularity || []
+            };
+        }
+        """, 'filter-selection'),
+        Output('filter-selection', 'data'),
+        Input('tag-filter', 'value'),
+        Input('genre-filter', 'value'),
+        Input('explicit-filter', 'value'),
+        Input('mode-filter', 'value'),
+        Input('key-filter', 'value'),
+        Input('time-signature-filter', 'value'),
+        Input('popularity-filter', 'value')
+    )
+    callback(chart_outputs, [Input('country-selection', 'data'), Input('filter-selection', 'data')],
+             **callback_options())(update_all_charts)
+
+
+clientside_callback(
+    """
+    function(countries, filters) {
+        const params = new URLSearchParams();
+        (countries || []).forEach(country => params.append('country', country));
+        if (filters) {
+            params.set('filters', JSON.stringify(filters));
+        }
+        const query = params.toString() ? '?' + params.toString() : '';
+        return ['/export.csv' + query, '/export.parquet' + query];
+    }
+    """,
+    Output('export-csv', 'href'),
+    Output('export-parquet', 'href'),
+    Input('country-selection', 'data'),
+    Input('filter-selection', 'data')
+)
+
+
+@callback(
+    Output('feature-heatmap', 'figure'),
+    Input('country-selection', 'data'),
+    Input('filter-selection', 'data'),
+    Input('heatmap-x', 'value'),
+    Input('heatmap-y', 'value'),
+    **callback_options()
+)
+@instrumented('update_heatmap')
+@cached_by_selection('page1-heatmap')
+def update_heatmap(selected_countries, filters, x_column, y_column):
+    # В браузер уходит только сетка HEATMAP_BINS × HEATMAP_BINS, сколько бы строк ни попало в выборку
+    data = dataset.current()
+    with phase('filter'):
+        rows = filtered_rows(data, selected_countries, filters)
+
+    with phase('aggregate'):
+        ranges = data.get('feature_ranges')
+        counts = binned_counts(data.df, x_column, y_column, ranges, rows=rows)
+
+    with phase('figure'):
+        patch = Patch()
+        # Пустые клетки окрашиваются в цвет фона (начало шкалы), поэтому нули передаём как есть
+        patch['data'][0]['z'] = encode_array(counts)
+        patch['data'][0]['x'] = encode_array(bin_centers(*ranges[x_column]))
+        patch['data'][0]['y'] = encode_array(bin_centers(*ranges[y_column]))
+        patch['layout']['xaxis']['title']['text'] = FEATURE_LABELS[x_column]
+        patch['layout']['yaxis']['title']['text'] = FEATURE_LABELS[y_column]
+    return patch
+
+
+@instrumented('update_quantiles')
+@cached_by_selection('page1-quantiles')
+def update_quantiles(selected_countries, filters):
+    # Выборка только по странам берётся из скетчей, если в ней больше EXACT_QUANTILE_ROWS треков;
+    # маленькие выборки и любые другие фильтры считаются точно по строкам
+    data = dataset.current()
+    sketches = data.get('quantile_sketches')
+    by_sketch = (not has_track_filters(data, filters)
+                 and sketches['duration_ms'].count(selected_countries) > EXACT_QUANTILE_ROWS)
+
+    with phase('aggregate'):
+        if by_sketch:
+            values = {column: sketch.quantiles(selected_countries) for column, sketch in sketches.items()}
+        else:
+            rows = filtered_rows(data, selected_countries, filters)
+            values = {}
+            for column in QUANTILE_COLUMNS:
+                column_values = data.df[column].to_numpy()
+                values[column] = exact_quantiles(column_values if rows is None else column_values[rows])
+
+    if np.isnan(values['duration_ms']).any():
+        return "—", "—"
+    prefix = "≈ " if by_sketch else ""
+    duration = prefix + " · ".join(ms_to_min_sec(value) for value in values['duration_ms'])
+    popularity = prefix + " · ".join(f"{value:.0f}" for value in values['popularity'])
+    return duration, popularity
+
+
+quantile_outputs = [
+    Output('duration-quantiles', 'children'),
+    Output('popularity-quantiles', 'children'),
+]
+
+if CLIENTSIDE_FILTERING:
+    # Те же оценки, что QuantileSketches.quantiles, по гистограммам выбранных стран
+    clientside_callback(
+        """
+        function(selected, sketches) {
+            const chosen = new Set(selected || []);
+            const estimate = sketch => {
+                const histogram = [];
+                for (let i = 0; i < sketch.country.length; i++) {
+                    if (chosen.size && !chosen.has(sketch.countries[sketch.country[i]])) {
+                        continue;
+                    }
+                    const bucket = sketch.bucket[i];
+                    histogram[bucket] = (histogram[bucket] || 0) + sketch.count[i];
+                }
+                const cumulative = [];
+                let total = 0;
+                for (let j = 0; j < histogram.length; j++) {
+                    total += histogram[j] || 0;
+                    cumulative.push(total);
+                }
+                if (!total) {
+                    return null;
+                }
+                return sketches.quantiles.map(q => {
+                    const rank = Math.max(Math.ceil(q * total), 1);
+                    const bucket = cumulative.findIndex(value => value >= rank);
+                    return bucket === 0 ? 0 : 2 * Math.pow(sketch.gamma, bucket - 1) / (sketch.gamma + 1);
+                });
+            };
+            const minSec = ms => {
+                const seconds = Math.floor((ms / 1000) % 60);
+                const minutes = Math.floor((ms / 60000) % 60);
+                return minutes + ':' + String(seconds).padStart(2, '0');
+            };
+
+            const duration = estimate(sketches.columns.duration_ms);
+            const popularity = estimate(sketches.columns.popularity);
+            if (!duration) {
+                return ['—', '—'];
+            }
+            return ['≈ ' + duration.map(minSec).join(' · '),
+                    '≈ ' + popularity.map(value => value.toFixed(0)).join(' · ')];
+        }
+        """,
+        quantile_outputs,
+        Input('country-filter', 'value'),
+        State('quantile-sketch-store', 'data')
+    )
+else:
+    callback(quantile_outputs, [Input('country-selection', 'data'), Input('filter-selection', 'data')],
+             **callback_options())(update_quantiles)
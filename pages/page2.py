@@ -1,246 +1,322 @@
+import os
+
 import dash
-from dash import html, dcc, callback, Output, Input
+from dash import html, dcc, callback, Output, Input, Patch
 import pandas as pd
 import plotly.express as px
 import dash_bootstrap_components as dbc
 
+from background import callback_options
+import dataset
+from figure_cache import cached_by_selection
+from filters import filtered_rows, has_track_filters
+from metrics import instrumented, phase
+from serialization import encode_array
+from sketches import DEFAULT_PRECISION, GroupSketches
+from topk import CountryTopK, select_rows
+from tracks import link_frame
+
 dash.register_page(__name__, path="/page2", name="Анализ музыкальных трендов")
 
-# Загрузка данных
-df = pd.read_csv("cleaned_dat.csv")
-
-# Подготовка данных для карты
-country_artist_counts = df.groupby('country')['artists'].nunique().reset_index()
-country_artist_counts.columns = ['country', 'artist_count']
-
-# Получаем топ-5 исполнителей по сумме popularity их треков
-top_artists = df.groupby('artists').agg(
-    total_popularity=('popularity', 'sum'),
-    track_count=('track_name', 'nunique')
-).reset_index().sort_values('total_popularity', ascending=False).head(5)
-top_artists['rank'] = range(1, 6)
-
-# Получаем топ-5 треков по popularity (уникальные треки)
-top_tracks = df.sort_values('popularity', ascending=False).drop_duplicates('track_name').head(5)
-top_tracks['rank'] = range(1, 6)
-
-layout = dbc.Container([
-    html.Div(style={"display": "none"}, children=[
-        html.Link(
-            rel="stylesheet",
-            href="https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap"
+
+# Приближённый режим карты: число исполнителей по странам оценивается по скетчам HyperLogLog
+APPROX_DISTINCT = os.environ.get('DASHBOARD_APPROX_DISTINCT') == '1'
+HLL_PRECISION = int(os.environ.get('DASHBOARD_HLL_PRECISION', DEFAULT_PRECISION))
+SKETCH_COLUMNS = ['country', 'artists']
+
+
+def count_artists_by_country(df, rows=None):
+    if rows is not None:
+        # Для выборки берём только два нужных столбца, а не все столбцы её строк
+        df = pd.DataFrame({column: df[column].take(rows) for column in ('country', 'artists')})
+    country_counts = df.groupby('country', observed=True)['artists'].nunique().reset_index()
+    country_counts.columns = ['country', 'artist_count']
+    return country_counts
+
+
+def make_map_figure(counts):
+    return px.choropleth(
+        counts,
+        locations='country',
+        locationmode='country names',
+        color='artist_count',
+        hover_name='country',
+        color_continuous_scale='YlOrRd',
+        labels={'artist_count': 'Кол-во'},
+        projection='natural earth'
+    ).update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font_color='white',
+        margin=dict(l=0, r=0, t=0, b=60),  # Увеличили нижний отступ для шкалы
+        coloraxis_colorbar=dict(
+            title='Кол-во',
+            title_font=dict(color='white'),
+            tickfont=dict(color='white'),
+            x=0.01,
+            y=-0.4,  # Позиция шкалы (0-1, где 0 - низ)
+            len=0.7,  # Длина шкалы
+            thickness=15,
+            yanchor='bottom'  # Привязка к низу
+        ),
+        geo=dict(
+            bgcolor='rgba(0,0,0,0)',
+            lakecolor='#D2F2EF',
+            landcolor='#242424',
+            subunitcolor='grey',
+            center=dict(lon=0, lat=0),  # Центр карты
+            projection_scale=1  # Масштаб карты
         )
-    ]),
+    )
+
+
+def append_topk(country_topk, new_links):
+    # Копия, чтобы запросы к предыдущей версии данных видели прежние топы;
+    # топы считаются по трекам, поэтому нужны только новые треки (их основные связи)
+    updated = country_topk.copy()
+    updated.append(new_links[new_links['primary']])
+    return updated
+
+
+def sketchable(data, filters):
+    # Скетчи есть только по странам и жанрам, остальные фильтры требуют точного подсчёта
+    filters = filters or {}
+    return not filters.get('tags') and set(data.get('filter_index').active(filters)) <= {'track_genre'}
+
+
+def map_counts(data, selected_countries, filters):
+    """(таблица country/artist_count, подписи для наведения)."""
+    if APPROX_DISTINCT and sketchable(data, filters):
+        counts = data.get('artist_sketches').by_country(selected_countries, (filters or {}).get('track_genre'))
+        hover = [f"{country}: ≈{count} (типичная ошибка ≈ ±{error}, 1σ)" for country, count, error
+                 in zip(counts['country'], counts['artist_count'], counts['error'])]
+        return counts, hover
+
+    rows = filtered_rows(data, selected_countries, filters)
+    counts = count_artists_by_country(data.df, rows)
+    return counts, counts['country'].tolist()
+
+
+def build_overview(data):
+    # Каркас карты строится один раз; при смене фильтра меняются только массивы данных
+    counts, hover = map_counts(data, [], None)
+    return {'map_figure': make_map_figure(counts).update_traces(hovertext=hover)}
+
+
+dataset.register_derived('page2_overview', build_overview)
+if APPROX_DISTINCT:
+    # Скетчи по парам (страна, жанр) строятся по связям с исполнителями их треков
+    dataset.register_derived('artist_sketches',
+                             lambda data: GroupSketches.build(link_frame(data.df, data.links, SKETCH_COLUMNS),
+                                                              HLL_PRECISION),
+                             append=lambda sketches, new_links: sketches.merge(
+                                 GroupSketches.build(new_links, HLL_PRECISION)))
+dataset.register_derived('country_topk', lambda data: CountryTopK.build(data.df), append=append_topk)
+
+
+def artist_rows(top_artists):
+    return [
+        html.Tr([
+            html.Td(f"{artist['rank']}.", style={
+                'textAlign': 'left',
+                'color': 'white',
+                'fontWeight': 'bold',
+                'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
+            }),
+            html.Td(artist['artists'], style={
+                'textAlign': 'left',
+                'color': 'white',
+                'fontWeight': 'bold',
+                'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
+            }),
+            html.Td(artist['track_count'], style={
+                'textAlign': 'right',
+                'color': 'white',
+                'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
+            })
+        ], style={'borderBottom': '1px solid #595959'})
+        for _, artist in top_artists.iterrows()
+    ]
 
-    dbc.Row([
-        # Левый столбец (43%)
-        dbc.Col([
 
-            # Чарт "Топ исполнителей"
+def track_items(top_tracks):
+    return [
+        dbc.ListGroupItem([
             html.Div([
-                html.H4("Топ исполнителей", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold',
-                }),
                 html.Div([
-                    html.Table([
-                        html.Thead([
-                        html.Tr([
-                            html.Th("Ранг", style={'color': 'white', 'padding': '12px 8px'}),
-                            html.Th("Исполнитель", style={'color': 'white', 'padding': '12px 8px'}),
-                            html.Th("Треков", style={'color': 'white', 'padding': '12px 8px'})
-                        ])
-                    ]),
-                        html.Tbody([
+                    html.Span(f"{track['rank']}. ", style={
+                        'fontWeight': 'bold',
+                        'color': '#22919D'
+                    }),
+                    html.Span(track['track_name'], style={
+                        'fontWeight': 'bold',
+                        'color': 'white'
+                    })
+                ]),
+                html.Div([
+                    html.Small(track['artists'], style={
+                        'color': 'lightgray',
+                        'fontSize': '14px'
+                    }),
+                ], style={'marginTop': '3px'})
+            ], style={'padding': '10px'})
+        ], style={
+            'backgroundColor': '#242424',
+            'borderColor': '#595959',
+            'borderLeft': f'4px solid #22919D',
+            'marginBottom': '10px'
+        })
+        for _, track in top_tracks.iterrows()
+    ]
+
+
+def layout(**kwargs):
+    # Макет строится при открытии страницы, поэтому импорт модуля не трогает данные
+    data = dataset.current()
+    overview = data.get('page2_overview')
+    top_artists = data.get('country_topk').query_artists([])
+    top_tracks = data.get('country_topk').query_tracks([])
+
+    return dbc.Container([
+        html.Div(style={"display": "none"}, children=[
+            html.Link(
+                rel="stylesheet",
+                href="https://fonts.googleapis.com/css2?family=Inter:wght@400;700&display=swap"
+            )
+        ]),
+
+        dbc.Row([
+            # Левый столбец (43%)
+            dbc.Col([
+
+                # Чарт "Топ исполнителей"
+                html.Div([
+                    html.H4("Топ исполнителей", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold',
+                    }),
+                    html.Div([
+                        html.Table([
+                            html.Thead([
                             html.Tr([
-                                html.Td(f"{artist['rank']}.", style={
-                                    'textAlign': 'left',
-                                    'color': 'white',
-                                    'fontWeight': 'bold',
-                                    'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
-                                }),
-                                html.Td(artist['artists'], style={
-                                    'textAlign': 'left',
-                                    'color': 'white',
-                                    'fontWeight': 'bold',
-                                    'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
-                                }),
-                                html.Td(artist['track_count'], style={
-                                    'textAlign': 'right',
-                                    'color': 'white',
-                                    'padding': '12px 8px'  # Увеличенные отступы внутри ячейки
-                                })
-                            ], style={'borderBottom': '1px solid #595959'}) for _, artist in top_artists.iterrows()
-                        ])
+                                html.Th("Ранг", style={'color': 'white', 'padding': '12px 8px'}),
+                                html.Th("Исполнитель", style={'color': 'white', 'padding': '12px 8px'}),
+                                html.Th("Треков", style={'color': 'white', 'padding': '12px 8px'})
+                            ])
+                        ]),
+                            html.Tbody(artist_rows(top_artists), id='top-artists-body')
+                        ], style={
+                            'width': '100%',
+                            'borderCollapse': 'collapse',
+                        })
                     ], style={
-                        'width': '100%',
-                        'borderCollapse': 'collapse',
+                        'backgroundColor': 'transparent',
+                        'padding': '10px'
                     })
                 ], style={
-                    'backgroundColor': 'transparent',
+                    'backgroundColor': '#242424',
+                    'borderRadius': '15px',
+                    'padding': '20px',
+                    'marginBottom': '20px'
+                }),
+
+                # Чарт "Топ треков"
+                html.Div([
+                    html.H4("Топ треков", style={
+                        'textAlign': 'center',
+                        'color': 'white',
+                        'marginBottom': '20px',
+                        'fontWeight': 'bold'
+                    }),
+                    dbc.ListGroup(track_items(top_tracks), id='top-tracks-list', flush=True)
+                ], style={
+                    'backgroundColor': '#242424',
+                    'borderRadius': '15px',
                     'padding': '10px'
                 })
-            ], style={
-                'backgroundColor': '#242424',
-                'borderRadius': '15px',
-                'padding': '20px',
-                'marginBottom': '20px'
-            }),
+            ], width=5),  # 43% ширины
 
-            # Чарт "Топ треков"
-            html.Div([
-                html.H4("Топ треков", style={
-                    'textAlign': 'center',
-                    'color': 'white',
-                    'marginBottom': '20px',
-                    'fontWeight': 'bold'
-                }),
-                dbc.ListGroup([
-                    dbc.ListGroupItem([
-                        html.Div([
-                            html.Div([
-                                html.Span(f"{track['rank']}. ", style={
-                                    'fontWeight': 'bold',
-                                    'color': '#22919D'
-                                }),
-                                html.Span(track['track_name'], style={
-                                    'fontWeight': 'bold',
-                                    'color': 'white'
-                                })
-                            ]),
-                            html.Div([
-                                html.Small(track['artists'], style={
-                                    'color': 'lightgray',
-                                    'fontSize': '14px'
-                                }),
-                            ], style={'marginTop': '3px'})
-                        ], style={'padding': '10px'})
-                    ], style={
-                        'backgroundColor': '#242424',
-                        'borderColor': '#595959',
-                        'borderLeft': f'4px solid #22919D',
-                        'marginBottom': '10px'
-                    }) for _, track in top_tracks.iterrows()
-                ], flush=True)
-            ], style={
-                'backgroundColor': '#242424',
-                'borderRadius': '15px',
-                'padding': '10px'
-            })
-        ], width=5),  # 43% ширины
-
-        # Правый столбец (57%) - Карта
-dbc.Col([
-    html.Div([
-        html.H4("Популярные исполнители на карте мира", style={
-            'textAlign': 'center',
-            'color': 'white',
-            'marginBottom': '20px',
-            'fontWeight': 'bold'
-        }),
-        dcc.Graph(
-            id='world-map',
-            figure=px.choropleth(
-                country_artist_counts,
-                locations='country',
-                locationmode='country names',
-                color='artist_count',
-                hover_name='country',
-                color_continuous_scale='YlOrRd',
-                labels={'artist_count': 'Кол-во'},
-                projection='natural earth'
-            ).update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font_color='white',
-                margin=dict(l=0, r=0, t=0, b=60),  # Увеличили нижний отступ для шкалы
-                coloraxis_colorbar=dict(
-                    title='Кол-во',
-                    title_font=dict(color='white'),
-                    tickfont=dict(color='white'),
-                    x=0.01,
-                    y=-0.4,  # Позиция шкалы (0-1, где 0 - низ)
-                    len=0.7,  # Длина шкалы
-                    thickness=15,
-                    yanchor='bottom'  # Привязка к низу
-                ),
-                geo=dict(
-                    bgcolor='rgba(0,0,0,0)',
-                    lakecolor='#D2F2EF',
-                    landcolor='#242424',
-                    subunitcolor='grey',
-                    center=dict(lon=0, lat=0),  # Центр карты
-                    projection_scale=1  # Масштаб карты
-                )
-            ),
-            style={
-                'margin': '0 auto',
-                'height': '70vh',
-                'paddingBottom': '40px'  # Дополнительный отступ снизу
-            }
-        )
-    ], style={
-        'backgroundColor': '#242424',
-        'borderRadius': '15px',
+            # Правый столбец (57%) - Карта
+    dbc.Col([
+        html.Div([
+            html.H4("Популярные исполнители на карте мира", style={
+                'textAlign': 'center',
+                'color': 'white',
+                'marginBottom': '20px',
+                'fontWeight': 'bold'
+            }),
+            dcc.Graph(
+                id='world-map',
+                figure=overview['map_figure'],
+                style={
+                    'margin': '0 auto',
+                    'height': '70vh',
+                    'paddingBottom': '40px'  # Дополнительный отступ снизу
+                }
+            )
+        ], style={
+            'backgroundColor': '#242424',
+            'borderRadius': '15px',
+            'padding': '20px',
+            'height': '100%'
+        })
+    ], width=7)
+        ], style={'marginTop': '20px'})
+    ], fluid=True, style={
         'padding': '20px',
-        'height': '100%'
+        'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
+        'fontFamily': 'Inter, sans-serif',
+        'minHeight': '100vh'
     })
-], width=7)
-    ], style={'marginTop': '20px'})
-], fluid=True, style={
-    'padding': '20px',
-    'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
-    'fontFamily': 'Inter, sans-serif',
-    'minHeight': '100vh'
-})
 
 
 @callback(
     Output('world-map', 'figure'),
-    Input('country-filter', 'value')
+    Input('country-selection', 'data'),
+    Input('filter-selection', 'data'),
+    **callback_options()
 )
-def update_map(selected_countries):
-    filtered_data = df.copy()
-    if selected_countries:
-        filtered_data = filtered_data[filtered_data['country'].isin(selected_countries)]
+@instrumented('update_map')
+@cached_by_selection('page2-map')
+def update_map(selected_countries, filters=None):
+    # Строки отбираются битовыми масками по странам, атрибутам треков и тегам,
+    # в приближённом режиме число исполнителей собирается из скетчей
+    with phase('groupby'):
+        country_counts, hover = map_counts(dataset.current(), selected_countries, filters)
 
-    # Обновляем данные для карты
-    country_counts = filtered_data.groupby('country')['artists'].nunique().reset_index()
-    country_counts.columns = ['country', 'artist_count']
+    # Отправляем только новые страны и значения, оформление карты остаётся прежним
+    with phase('figure'):
+        patch = Patch()
+        patch['data'][0]['locations'] = country_counts['country'].tolist()
+        patch['data'][0]['hovertext'] = hover
+        patch['data'][0]['z'] = encode_array(country_counts['artist_count'])
+    return patch
 
-    # Создаем обновленную карту
-    fig = px.choropleth(
-    country_counts,
-    locations='country',
-    locationmode='country names',
-    color='artist_count',
-    hover_name='country',
-    hover_data={'artist_count': True, 'country': False},
-    color_continuous_scale='YlOrRd',
-    labels={'artist_count': 'Количество исполнителей'},
-    projection='natural earth'
-).update_layout(
-    plot_bgcolor='rgba(0,0,0,0)',
-    paper_bgcolor='rgba(0,0,0,0)',
-    font_color='white',
-    margin=dict(l=0, r=0, t=0, b=0),
-    coloraxis_colorbar=dict(
-        title='Количество исполнителей',  # Более описательное название
-        x=0.02,
-        y=0.15,
-        len=0.7,
-        thickness=15,
-        tickfont=dict(color='white'),
-        titlefont=dict(color='white')
-    ),
-    geo=dict(
-        bgcolor='rgba(0,0,0,0)',
-        lakecolor='#D2F2EF',
-        landcolor='#242424',
-        subunitcolor='grey'
-    )
+
+@callback(
+    Output('top-artists-body', 'children'),
+    Output('top-tracks-list', 'children'),
+    Input('country-selection', 'data'),
+    Input('filter-selection', 'data'),
+    **callback_options()
 )
+@instrumented('update_top_lists')
+@cached_by_selection('page2-top')
+def update_top_lists(selected_countries, filters=None):
+    # Только по странам топы собираются из частичных топов выбранных стран,
+    # с остальными фильтрами - строятся заново по отобранным строкам
+    with phase('aggregate'):
+        data = dataset.current()
+        if has_track_filters(data, filters):
+            rows = filtered_rows(data, selected_countries, filters)
+            country_topk = CountryTopK.build(select_rows(data.df, rows), appendable=False)
+            selected_countries = []
+        else:
+            country_topk = data.get('country_topk')
+        top_artists = country_topk.query_artists(selected_countries)
+        top_tracks = country_topk.query_tracks(selected_countries)
 
-    return fig
\ No newline at end of file
+    with phase('figure'):
+        return artist_rows(top_artists), track_items(top_tracks)
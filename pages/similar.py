@@ -0,0 +1,143 @@
+import dash
+from dash import html, dcc, callback, Output, Input
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+
+import dataset
+from metrics import instrumented, phase
+from pages.track import CARD_STYLE, track_href
+from search import MIN_QUERY_LENGTH
+from similarity import TrackSimilarity
+
+dash.register_page(__name__, path="/similar", name="Похожие треки")
+
+K_OPTIONS = [5, 10, 20, 50]
+
+DROPDOWN_STYLE = {
+    'backgroundColor': '#595959',
+    'borderRadius': '20px',
+    'color': 'black',
+    'fontSize': '16px'
+}
+
+dataset.register_derived('track_similarity', lambda data: TrackSimilarity(data.df))
+
+
+def track_option(data, track_id):
+    rows = data.get('search_index').track_rows_of(track_id)
+    if not len(rows):
+        return []
+    track = data.df.iloc[rows[0]]
+    return [{'label': f"{track['track_name']} — {track['artists']}", 'value': track_id}]
+
+
+def similar_rows(data, codes, distances):
+    tracks = data.df.iloc[codes]
+    return [
+        html.Tr([
+            html.Td(f"{rank}.", style={'color': 'white', 'fontWeight': 'bold', 'padding': '12px 8px'}),
+            html.Td(dcc.Link(track['track_name'], href=track_href(track['track_id']), style={'color': 'white'}),
+                    style={'padding': '12px 8px'}),
+            html.Td(track['artists'], style={'color': 'lightgray', 'padding': '12px 8px'}),
+            html.Td(track['country'], style={'color': 'lightgray', 'padding': '12px 8px'}),
+            html.Td(f"{distance:.2f}", style={'color': 'white', 'textAlign': 'right', 'padding': '12px 8px'})
+        ], style={'borderBottom': '1px solid #595959'})
+        for rank, ((_, track), distance) in enumerate(zip(tracks.iterrows(), distances), start=1)
+    ]
+
+
+def layout(id=None, **kwargs):
+    data = dataset.current()
+    filter_index = data.get('filter_index')
+
+    return dbc.Container([
+        html.Div([
+            dbc.Row([
+                dbc.Col([
+                    dbc.Label('Трек', style={'fontWeight': 'bold', 'color': 'white'}),
+                    dcc.Dropdown(id='similar-track', options=track_option(data, id) if id else [],
+                                 value=id, placeholder="Начните вводить название", style=DROPDOWN_STYLE)
+                ], width=5),
+                dbc.Col([
+                    dbc.Label('Страна', style={'fontWeight': 'bold', 'color': 'white'}),
+                    dcc.Dropdown(id='similar-country', options=filter_index.values('country'), value=[],
+                                 multi=True, placeholder="Все страны", style=DROPDOWN_STYLE)
+                ], width=3),
+                dbc.Col([
+                    dbc.Label('Жанр', style={'fontWeight': 'bold', 'color': 'white'}),
+                    dcc.Dropdown(id='similar-genre', options=filter_index.values('track_genre'), value=[],
+                                 multi=True, placeholder="Все жанры", style=DROPDOWN_STYLE)
+                ], width=3),
+                dbc.Col([
+                    dbc.Label('Сколько', style={'fontWeight': 'bold', 'color': 'white'}),
+                    dcc.Dropdown(id='similar-k', options=K_OPTIONS, value=10, clearable=False,
+                                 style=DROPDOWN_STYLE)
+                ], width=1),
+            ])
+        ], style={
+            'borderRadius': '45px',
+            'backgroundColor': '#242424',
+            'padding': '25px',
+            'marginBottom': '30px'
+        }),
+
+        html.Div([
+            html.H4("Похожие по звучанию треки", style={
+                'textAlign': 'center',
+                'fontWeight': 'bold',
+                'marginBottom': '20px'
+            }),
+            html.Table([
+                html.Thead(html.Tr([
+                    html.Th("Ранг", style={'color': 'white', 'padding': '12px 8px'}),
+                    html.Th("Трек", style={'color': 'white', 'padding': '12px 8px'}),
+                    html.Th("Исполнитель", style={'color': 'white', 'padding': '12px 8px'}),
+                    html.Th("Страна", style={'color': 'white', 'padding': '12px 8px'}),
+                    html.Th("Расстояние", style={'color': 'white', 'padding': '12px 8px', 'textAlign': 'right'})
+                ])),
+                html.Tbody(id='similar-tracks-body')
+            ], style={'width': '100%', 'borderCollapse': 'collapse'})
+        ], style=CARD_STYLE)
+    ], fluid=True, style={
+        'padding': '20px',
+        'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
+        'fontFamily': 'Inter',
+        'minHeight': '100vh'
+    })
+
+
+@callback(
+    Output('similar-track', 'options'),
+    Input('similar-track', 'search_value')
+)
+def update_track_options(query):
+    if not query or len(query.strip()) < MIN_QUERY_LENGTH:
+        raise PreventUpdate
+    results = dataset.derived('search_index').search(query, limit=20)
+    return [{'label': f"{r['name']} — {r['artist']}", 'value': r['id'], 'search': r['search']}
+            for r in results if r['kind'] == 'track'][:10]
+
+
+@callback(
+    Output('similar-tracks-body', 'children'),
+    Input('similar-track', 'value'),
+    Input('similar-country', 'value'),
+    Input('similar-genre', 'value'),
+    Input('similar-k', 'value')
+)
+@instrumented('update_similar_tracks')
+def update_similar_tracks(track_id, countries, genres, k):
+    if not track_id:
+        return []
+    data = dataset.current()
+    similarity = data.get('track_similarity')
+
+    # Ограничение по стране и жанру - через битовые маски; строки индекса и есть коды треков
+    with phase('filter'):
+        candidates = data.get('filter_index').rows({'country': countries, 'track_genre': genres})
+
+    with phase('neighbours'):
+        codes, distances = similarity.neighbours(track_id, k or 10, candidates)
+
+    with phase('figure'):
+        return similar_rows(data, codes, distances)
@@ -0,0 +1,159 @@
+from urllib.parse import quote
+
+import dash
+from dash import html, dcc, callback, Output, Input, no_update
+from dash.exceptions import PreventUpdate
+import dash_bootstrap_components as dbc
+
+import dataset
+from metrics import instrumented, phase
+from pages.page1 import ms_to_min_sec
+from search import MIN_QUERY_LENGTH, SearchIndex
+from tracks import RowGroups
+
+dash.register_page(__name__, path="/track", name="Трек")
+
+FEATURE_NAMES = {
+    'danceability': 'Танцевальность',
+    'energy': 'Энергичность',
+    'loudness': 'Громкость, дБ',
+    'speechiness': 'Речь',
+    'acousticness': 'Акустичность',
+    'instrumentalness': 'Инструментальность',
+    'liveness': 'Живое исполнение',
+    'valence': 'Позитивность',
+    'tempo': 'Темп, BPM',
+}
+
+CARD_STYLE = {
+    'backgroundColor': '#242424',
+    'borderRadius': '15px',
+    'padding': '20px',
+    'marginBottom': '20px',
+    'color': 'white'
+}
+
+dataset.register_derived('search_index', lambda data: SearchIndex(data.df, data.version))
+# Треки каждого исполнителя по коду категории
+dataset.register_derived('artist_rows', lambda data: RowGroups(data.df['artists'].cat.codes.to_numpy(),
+                                                               len(data.df['artists'].cat.categories)))
+
+
+def info_row(label, value):
+    return html.Tr([
+        html.Td(label, style={'color': 'lightgray', 'padding': '8px'}),
+        html.Td(value, style={'color': 'white', 'fontWeight': 'bold', 'padding': '8px'})
+    ], style={'borderBottom': '1px solid #595959'})
+
+
+def track_href(track_id):
+    return f"/track?id={quote(str(track_id), safe='')}"
+
+
+def artist_href(artist):
+    return f"/track?artist={quote(str(artist), safe='')}"
+
+
+def track_details(data, track_id):
+    rows = data.get('search_index').track_rows_of(track_id)
+    if not len(rows):
+        return html.Div("Трек не найден", style=CARD_STYLE)
+    track = data.df.iloc[rows[0]]
+    positions = data.get('track_links').of(rows[0])
+    genres = ', '.join(str(genre) for genre in data.links['track_genre'].take(positions).unique())
+
+    return dbc.Row([
+        dbc.Col(html.Div([
+            html.H4(track['track_name'], style={'fontWeight': 'bold'}),
+            dcc.Link(str(track['artists']), href=artist_href(track['artists']), style={'color': '#9FD5D7'}),
+            html.Table([
+                info_row("Альбом", track['album_name']),
+                info_row("Страна", track['country']),
+                info_row("Стиль", track['style']),
+                info_row("Жанры", genres),
+                info_row("Популярность", int(track['popularity'])),
+                info_row("Длительность", ms_to_min_sec(track['duration_ms'])),
+                info_row("Explicit", "да" if track['explicit'] else "нет"),
+            ], style={'width': '100%', 'marginTop': '15px'}),
+            dcc.Link("Похожие треки →", href=f"/similar?id={quote(str(track_id), safe='')}",
+                     style={'color': '#9FD5D7', 'display': 'block', 'marginTop': '15px'})
+        ], style=CARD_STYLE), width=6),
+        dbc.Col(html.Div([
+            html.H4("Аудио-характеристики", style={'fontWeight': 'bold'}),
+            html.Table([info_row(label, f"{track[column]:.3f}") for column, label in FEATURE_NAMES.items()],
+                       style={'width': '100%', 'marginTop': '15px'})
+        ], style=CARD_STYLE), width=6)
+    ])
+
+
+def artist_details(data, artist):
+    df = data.df
+    code = df['artists'].cat.categories.get_indexer([artist])[0]
+    rows = data.get('artist_rows').of(code) if code >= 0 else []
+    if not len(rows):
+        return html.Div("Исполнитель не найден", style=CARD_STYLE)
+    tracks = df.take(rows)
+    top_tracks = tracks.nlargest(20, 'popularity')
+
+    return html.Div([
+        html.H4(artist, style={'fontWeight': 'bold'}),
+        html.Div(f"{tracks['country'].iloc[0]} · {tracks['style'].iloc[0]} · "
+                 f"треков: {len(tracks)}", style={'color': 'lightgray', 'marginBottom': '15px'}),
+        dbc.ListGroup([
+            dbc.ListGroupItem(
+                dcc.Link(f"{track['track_name']} ({track['popularity']})", href=track_href(track['track_id']),
+                         style={'color': 'white'}),
+                style={'backgroundColor': '#242424', 'borderColor': '#595959'}
+            )
+            for _, track in top_tracks.iterrows()
+        ], flush=True)
+    ], style=CARD_STYLE)
+
+
+def layout(id=None, artist=None, **kwargs):
+    data = dataset.current()
+    if id:
+        content = track_details(data, id)
+    elif artist:
+        content = artist_details(data, artist)
+    else:
+        content = html.Div("Найдите трек или исполнителя через поиск вверху страницы", style=CARD_STYLE)
+
+    return dbc.Container([content], fluid=True, style={
+        'padding': '20px',
+        'background': 'linear-gradient(45deg, #D2F2EF, #9FD5D7)',
+        'fontFamily': 'Inter',
+        'minHeight': '100vh'
+    })
+
+
+@callback(
+    Output('search-box', 'options'),
+    Input('search-box', 'search_value')
+)
+@instrumented('search')
+def update_search_options(query):
+    # Варианты приходят с сервера по мере ввода, индекс отвечает без прохода по таблице
+    if not query or len(query.strip()) < MIN_QUERY_LENGTH:
+        raise PreventUpdate
+    with phase('search'):
+        results = dataset.derived('search_index').search(query)
+    return [
+        {'label': f"{r['name']} — {r['artist']}", 'value': f"track:{r['id']}", 'search': r['search']}
+        if r['kind'] == 'track'
+        else {'label': f"{r['name']} (исполнитель)", 'value': f"artist:{r['id']}", 'search': r['search']}
+        for r in results
+    ]
+
+
+@callback(
+    Output('url', 'href'),
+    Input('search-box', 'value'),
+    prevent_initial_call=True
+)
+def open_search_result(value):
+    # Выбор варианта открывает страницу трека или исполнителя
+    if not value:
+        return no_update
+    kind, _, key = value.partition(':')
+    return track_href(key) if kind == 'track' else artist_href(key)
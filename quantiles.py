@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Квантили (медиана, p90, p99) по любой выборке стран без прохода по строкам.
+# Скетчи строятся по каноническим трекам, поэтому трек из нескольких жанров учитывается один раз.
+# Для каждой страны хранится гистограмма по логарифмическим корзинам, как в DDSketch:
+# корзина i покрывает (gamma^(i-2), gamma^(i-1)], поэтому квантиль восстанавливается
+# с относительной ошибкой не больше alpha. Скетчи групп объединяются сложением гистограмм,
+# скетч выборки - сумма строк матрицы, его размер не зависит от числа треков.
+# Пар (страна, жанр) здесь нет: трек из нескольких жанров попал бы в сумму по выбранным жанрам
+# несколько раз, поэтому выборки с фильтром по жанру считаются точно по строкам (update_quantiles).
+
+DEFAULT_ALPHA = 0.01
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+def _bucket_index(values, gamma):
+    # Корзина 0 - нулевые и отрицательные значения; значения из (0, 1] попадают в корзину единицы,
+    # для целочисленных столбцов (миллисекунды, популярность) это точно
+    values = np.asarray(values, dtype=np.float64)
+    index = np.zeros(len(values), dtype=np.int64)
+    positive = values > 0
+    index[positive] = np.maximum(np.ceil(np.log(values[positive]) / np.log(gamma)), 0).astype(np.int64) + 1
+    return index
+
+
+def exact_quantiles(values, quantiles=QUANTILES):
+    values = np.asarray(values)
+    if not len(values):
+        return np.full(len(quantiles), np.nan)
+    return np.quantile(values, quantiles, method='inverted_cdf')
+
+
+class QuantileSketches:
+    def __init__(self, keys, counts, alpha):
+        # keys: Index стран; counts: гистограмма по строке на страну
+        self.keys = keys
+        self.counts = counts
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+
+    @classmethod
+    def build(cls, df, column, alpha=DEFAULT_ALPHA):
+        gamma = (1 + alpha) / (1 - alpha)
+        group_codes, keys = pd.factorize(df['country'].astype(str))
+        buckets = _bucket_index(df[column].to_numpy(), gamma)
+        width = int(buckets.max()) + 1 if len(buckets) else 1
+        counts = np.bincount(group_codes.astype(np.int64) * width + buckets,
+                             minlength=len(keys) * width).reshape(len(keys), width)
+        return cls(pd.Index(keys, name='country'), counts, alpha)
+
+    def merge(self, other):
+        keys = self.keys.union(other.keys)
+        counts = np.zeros((len(keys), max(self.counts.shape[1], other.counts.shape[1])), dtype=np.int64)
+        for sketches in (self, other):
+            counts[keys.get_indexer(sketches.keys), :sketches.counts.shape[1]] += sketches.counts
+        return QuantileSketches(keys, counts, self.alpha)
+
+    def histogram(self, selected_countries=None):
+        if not selected_countries:
+            return self.counts.sum(axis=0)
+        return self.counts[self.keys.isin(selected_countries)].sum(axis=0)
+
+    def count(self, selected_countries=None):
+        return int(self.histogram(selected_countries).sum())
+
+    def payload(self):
+        """Компактное представление для dcc.Store: непустые корзины по странам (страна, корзина, счётчик)."""
+        countries, buckets = np.nonzero(self.counts)
+        return {
+            'countries': [str(key) for key in self.keys],
+            'gamma': self.gamma,
+            'country': countries.tolist(),
+            'bucket': buckets.tolist(),
+            'count': self.counts[countries, buckets].tolist(),
+        }
+
+    def quantiles(self, selected_countries=None, quantiles=QUANTILES):
+        """Оценки квантилей выборки с относительной ошибкой alpha (NaN, если выборка пуста)."""
+        cumulative = np.cumsum(self.histogram(selected_countries))
+        total = cumulative[-1]
+        if not total:
+            return np.full(len(quantiles), np.nan)
+        # Та же позиция, что у exact_quantiles(method='inverted_cdf'): первый элемент с долей >= q
+        ranks = np.maximum(np.ceil(np.asarray(quantiles) * total), 1)
+        buckets = np.searchsorted(cumulative, ranks)
+        # Середина корзины (gamma^(j-1), gamma^j] в смысле относительной ошибки
+        estimates = 2 * np.power(self.gamma, buckets - 1.0) / (self.gamma + 1)
+        return np.where(buckets == 0, 0.0, estimates)
@@ -0,0 +1,123 @@
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from flask import jsonify, request
+
+import dataset
+
+# Горячая перезагрузка датасета без перезапуска сервера: фоновый поток следит
+# за файлом, а POST /admin/reload запускает перезагрузку вручную.
+# Новая версия собирается в фоне и подменяет текущую одной операцией присваивания.
+
+RELOAD_INTERVAL = float(os.environ.get('DASHBOARD_RELOAD_INTERVAL', '0'))
+ADMIN_TOKEN = os.environ.get('DASHBOARD_ADMIN_TOKEN')
+# При запуске через serve.py приложение импортируется в мастере до fork, а потоки
+# в дочерние процессы не переходят: следящий поток запускает каждый воркер после fork
+PREFORK = os.environ.get('DASHBOARD_PREFORK') == '1'
+# Под gunicorn следящий поток работает всегда (по умолчанию раз в 5 с): через него воркеры
+# подхватывают и новый файл, и перезагрузку, запрошенную через /admin/reload у другого воркера
+PREFORK_RELOAD_INTERVAL = float(os.environ.get('DASHBOARD_PREFORK_RELOAD_INTERVAL', '5'))
+# Файл-метка запроса перезагрузки, общий для всех воркеров
+RELOAD_MARKER = os.environ.get('DASHBOARD_RELOAD_MARKER', os.path.join(dataset.CACHE_DIR, 'reload-request.json'))
+
+_state = {'running': False, 'last_reload': None, 'last_error': None, 'marker': None}
+_state_lock = threading.Lock()
+
+
+def run_reload(full=False):
+    with _state_lock:
+        if _state['running']:
+            return False
+        _state['running'] = True
+    start = time.perf_counter()
+    try:
+        if dataset.reload(full=full):
+            _state['last_reload'] = time.time()
+            print(f"Датасет перезагружен за {time.perf_counter() - start:.2f} с, "
+                  f"версия {dataset.current().version[:12]}", file=sys.stderr)
+            print(dataset.startup_report(dataset.reload_timings, 'Фазы перезагрузки'), file=sys.stderr)
+        _state['last_error'] = None
+    except Exception:
+        _state['last_error'] = traceback.format_exc()
+        print(_state['last_error'], file=sys.stderr)
+    finally:
+        _state['running'] = False
+    return True
+
+
+def request_reload(full=False):
+    # Метка меняется атомарно (запись во временный файл и rename), воркеры сравнивают её время изменения
+    os.makedirs(os.path.dirname(os.path.abspath(RELOAD_MARKER)), exist_ok=True)
+    tmp_path = f'{RELOAD_MARKER}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'full': full, 'requested': time.time()}, f)
+    os.replace(tmp_path, RELOAD_MARKER)
+    # Воркер, принявший запрос, перезагружается сам и не повторяет перезагрузку по своей же метке
+    marker = _read_marker()
+    _state['marker'] = marker[0] if marker else None
+
+
+def _read_marker():
+    """(время изменения метки, full) или None, если метки нет."""
+    try:
+        stamp = os.stat(RELOAD_MARKER).st_mtime_ns
+        with open(RELOAD_MARKER, 'r', encoding='utf-8') as f:
+            return stamp, bool(json.load(f).get('full'))
+    except (OSError, ValueError):
+        return None
+
+
+def _watch(interval):
+    marker = _read_marker()
+    _state['marker'] = marker[0] if marker else None
+    while True:
+        time.sleep(interval)
+        marker = _read_marker()
+        if marker is not None and marker[0] != _state['marker']:
+            # Если перезагрузка уже идёт, метка останется непрочитанной до следующего шага
+            if run_reload(full=marker[1]):
+                _state['marker'] = marker[0]
+        else:
+            run_reload()
+
+
+def start_watcher(interval=RELOAD_INTERVAL):
+    thread = threading.Thread(target=_watch, args=(interval,), name='dataset-watcher', daemon=True)
+    thread.start()
+    return thread
+
+
+def _authorized():
+    # Сравнение за постоянное время: по задержке ответа нельзя подбирать токен посимвольно
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+def init_app(server):
+    if RELOAD_INTERVAL > 0 and not PREFORK:
+        start_watcher()
+
+    if not ADMIN_TOKEN:
+        return
+
+    @server.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+        if not _authorized():
+            return jsonify(error='forbidden'), 403
+        full = request.args.get('full') == '1'
+        if PREFORK:
+            # Остальные воркеры увидят метку на следующем шаге своего следящего потока
+            request_reload(full)
+        threading.Thread(target=run_reload, args=(full,), name='dataset-reload', daemon=True).start()
+        return jsonify(status='started', version=dataset.current().version), 202
+
+    @server.route('/admin/reload', methods=['GET'])
+    def admin_reload_status():
+        if not _authorized():
+            return jsonify(error='forbidden'), 403
+        return jsonify(version=dataset.current().version, running=_state['running'],
+                       last_reload=_state['last_reload'], last_error=_state['last_error'])
@@ -0,0 +1,170 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import dataset
+
+# Поиск треков и исполнителей для автодополнения.
+# Названия приводятся к единому виду (без регистра и диакритики), затем для каждого
+# слова названия сохраняется хвост строки, начиная с этого слова. Хвосты отсортированы,
+# поэтому все названия, где какое-то слово начинается с запроса, - это один диапазон,
+# который находится двоичным поиском без прохода по таблице. Хвост хранится не строкой,
+# а смещением в общем буфере кодов символов; буфер и смещения - массивы numpy,
+# с DASHBOARD_SHARED_ARRAYS=1 общие для всех воркеров через отображение в память.
+
+MIN_QUERY_LENGTH = 2
+# Длина хранимого хвоста; более длинные запросы дополнительно проверяются по полному названию
+MAX_SUFFIX_LENGTH = 32
+# Слово начинается с непробельного символа после начала названия или одного из разделителей
+WORD_SEPARATORS = ' -([/&.,'
+COMBINING_MARKS = r'[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]'
+# Названия склеиваются в один буфер через перевод строки: после fold его нет внутри названий,
+# и он меньше любого их символа, поэтому хвост, дошедший до конца названия, сортируется как обрезанный
+NAME_END = '\n'
+# Символов в одном ключе сортировки: код символа занимает 21 бит, в uint64 помещаются три
+CHARS_PER_KEY = 3
+
+
+def fold(names):
+    # "Beyoncé" и "BEYONCE" дают одну и ту же строку; нелатинские буквы сохраняются
+    return (pd.Series(names, dtype=object).astype(str)
+            .str.normalize('NFKD')
+            .str.replace(COMBINING_MARKS, '', regex=True)
+            .str.casefold()
+            .str.replace(r'\s+', ' ', regex=True)
+            .str.strip())
+
+
+def fold_query(query):
+    return fold([query]).iloc[0]
+
+
+def _suffix_order(codes, positions):
+    """Позиции хвостов, упорядоченные по первым MAX_SUFFIX_LENGTH символам.
+
+    Поразрядная сортировка с младших символов: на каждом шаге устойчиво сортируются
+    три символа, упакованные в uint64, - память O(числа хвостов), без таблицы всех ключей.
+    """
+    padded = np.concatenate([codes.astype(np.uint64), np.zeros(MAX_SUFFIX_LENGTH, dtype=np.uint64)])
+    order = np.arange(len(positions))
+    for offset in reversed(range(0, MAX_SUFFIX_LENGTH, CHARS_PER_KEY)):
+        at = positions[order] + offset
+        key = np.zeros(len(order), dtype=np.uint64)
+        for i in range(offset, min(offset + CHARS_PER_KEY, MAX_SUFFIX_LENGTH)):
+            key = (key << np.uint64(21)) | padded[at + (i - offset)]
+        order = order[np.argsort(key, kind='stable')]
+    return positions[order].astype(np.int32)
+
+
+def _shared(values, version, name):
+    # Файл, отображаемый в память каждым воркером (см. dataset.share_columns). Порядок исполнителей
+    # следует порядку категорий, а он у дописанной и заново загруженной таблицы одной версии разный,
+    # поэтому имя файла включает хэш содержимого
+    if version is None or not dataset.SHARED_ARRAYS:
+        return values
+    digest = hashlib.sha256(np.ascontiguousarray(values).tobytes()).hexdigest()[:12]
+    return dataset.share_columns(pd.DataFrame({'values': values}), version,
+                                 f'search.{name}.{digest}')['values'].to_numpy()
+
+
+class SearchIndex:
+    def __init__(self, df, version=None):
+        # Строка канонической таблицы - один трек, номер элемента поиска совпадает с номером строки
+        self.track_ids = pd.Index(df['track_id'])
+
+        artists = df.groupby('artists', observed=True)['popularity'].sum()
+        self.n_tracks = len(df)
+        # Подписи не копируются в списки: названия треков - столбец таблицы, исполнители - категории
+        self.track_names = df['track_name'].to_numpy()
+        self.artists = df['artists'].array
+        self.artist_names = artists.index.astype(str)
+        self.popularity = np.concatenate([df['popularity'].to_numpy().astype(np.int64),
+                                          artists.to_numpy(dtype=np.int64)])
+
+        # Все приведённые названия - один массив кодов символов; name_starts[i] - начало i-го названия
+        folded = fold(np.concatenate([self.track_names, self.artist_names.to_numpy(dtype=object)]))
+        text = NAME_END.join(folded.tolist()) + NAME_END
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+        name_starts = np.concatenate([[0], np.cumsum(folded.str.len().to_numpy() + 1)]).astype(np.int64)
+
+        boundaries = np.array([ord(c) for c in WORD_SEPARATORS + NAME_END], dtype=np.uint32)
+        previous = np.concatenate([[ord(NAME_END)], codes[:-1]])
+        word_start = (np.isin(previous, boundaries)
+                      & (codes != ord(' ')) & (codes != ord(NAME_END)))
+        order = _suffix_order(codes, np.flatnonzero(word_start))
+
+        self.codes = _shared(codes, version, 'codes')
+        self.name_starts = _shared(name_starts, version, 'name_starts')
+        # Начала хвостов в буфере в порядке сортировки
+        self.suffix_order = _shared(order, version, 'suffix_order')
+
+    def _label(self, entry):
+        if entry < self.n_tracks:
+            return str(self.track_names[entry])
+        return self.artist_names[entry - self.n_tracks]
+
+    def _text(self, start, stop):
+        return self.codes[start:stop].tobytes().decode('utf-32-le')
+
+    def _folded(self, entry):
+        return self._text(self.name_starts[entry], self.name_starts[entry + 1] - 1)
+
+    def _suffix(self, rank):
+        position = int(self.suffix_order[rank])
+        return self._text(position, position + MAX_SUFFIX_LENGTH).split(NAME_END, 1)[0]
+
+    def _bound(self, key, past_prefix):
+        # Двоичный поиск по хвостам: первый >= key или (past_prefix) первый после всех, начинающихся с key
+        low, high = 0, len(self.suffix_order)
+        while low < high:
+            middle = (low + high) // 2
+            suffix = self._suffix(middle)
+            if suffix < key or (past_prefix and suffix.startswith(key)):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _matches(self, folded_query):
+        key = folded_query[:MAX_SUFFIX_LENGTH]
+        start = self._bound(key, False)
+        stop = self._bound(key, True)
+        positions = self.suffix_order[start:stop]
+        entries = np.unique(np.searchsorted(self.name_starts, positions, side='right') - 1).astype(np.int32)
+        if len(folded_query) > MAX_SUFFIX_LENGTH:
+            entries = np.array([e for e in entries if folded_query in self._folded(e)], dtype=np.int32)
+        return entries
+
+    def search(self, query, limit=10):
+        """Список найденных треков и исполнителей, самые популярные первыми."""
+        folded_query = fold_query(query or '')
+        if len(folded_query) < MIN_QUERY_LENGTH:
+            return []
+        entries = self._matches(folded_query)
+        if len(entries) > limit:
+            best = np.argpartition(-self.popularity[entries], limit)[:limit]
+            entries = entries[best]
+        entries = entries[np.argsort(-self.popularity[entries], kind='stable')]
+
+        # search - приведённая строка для фильтра dcc.Dropdown в браузере: он сравнивает запрос
+        # с подписью без свёртки диакритики и иначе скрыл бы "Beyoncé" по запросу "beyonce"
+        entries = entries.tolist()
+        track_artists = [str(self.artists[e]) for e in entries if e < self.n_tracks]
+        folded_artists = iter(fold(track_artists).tolist())
+        track_artists = iter(track_artists)
+        results = []
+        for entry in entries:
+            if entry < self.n_tracks:
+                results.append({'kind': 'track', 'id': self.track_ids[entry],
+                                'name': self._label(entry), 'artist': next(track_artists),
+                                'search': f'{self._folded(entry)} {next(folded_artists)}'})
+            else:
+                results.append({'kind': 'artist', 'id': self._label(entry), 'name': self._label(entry),
+                                'search': self._folded(entry)})
+        return results
+
+    def track_rows_of(self, track_id):
+        """Номер строки трека (массив из одного элемента) или пустой массив."""
+        code = self.track_ids.get_indexer([track_id])[0]
+        return np.arange(code, code + 1) if code >= 0 else np.arange(0)
@@ -0,0 +1,194 @@
+import base64
+import gzip
+import itertools
+import json
+import os
+import threading
+
+import dash
+import numpy as np
+from flask import g, jsonify, request
+from plotly.utils import PlotlyJSONEncoder
+
+import metrics
+
+# Компактные ответы сервера:
+# - сжатие JSON callback'ов и статических файлов (flask-compress, если установлен, иначе gzip);
+# - числовые массивы фигур в бинарном виде (typed arrays plotly.js: dtype + base64);
+# - округление отображаемых чисел до DASHBOARD_FLOAT_DIGITS знаков;
+# - отчёт о размере ответов callback'ов на /metrics и /output-sizes; размер каждого выхода
+#   замеряется по результату callback'а (не разбором ответа) в одном запросе из
+#   DASHBOARD_OUTPUT_SIZES_SAMPLE, по умолчанию выключен: замер - лишняя сериализация результата.
+
+COMPRESS = os.environ.get('DASHBOARD_COMPRESS', '1') != '0'
+TYPED_ARRAYS = os.environ.get('DASHBOARD_TYPED_ARRAYS') == '1'
+FLOAT_DIGITS = int(os.environ.get('DASHBOARD_FLOAT_DIGITS', '3'))
+COMPRESS_MIN_BYTES = 500
+# Короткие массивы в base64 не короче JSON, их оставляем списками
+TYPED_ARRAY_MIN_SIZE = 64
+OUTPUT_SIZES_SAMPLE = int(os.environ.get('DASHBOARD_OUTPUT_SIZES_SAMPLE', '0'))
+COMPRESS_MIMETYPES = {'application/json', 'application/javascript', 'text/javascript', 'text/css',
+                      'text/html', 'text/plain'}
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+INT_DTYPES = [('u1', 0, 2 ** 8 - 1), ('i1', -2 ** 7, 2 ** 7 - 1), ('u2', 0, 2 ** 16 - 1),
+              ('i2', -2 ** 15, 2 ** 15 - 1), ('u4', 0, 2 ** 32 - 1), ('i4', -2 ** 31, 2 ** 31 - 1)]
+
+
+def _int_dtype(values):
+    if not values.size:
+        return 'u1'
+    low, high = values.min(), values.max()
+    for dtype, dtype_low, dtype_high in INT_DTYPES:
+        if dtype_low <= low and high <= dtype_high:
+            return dtype
+    return 'f8'
+
+
+def encode_array(values):
+    """Числовой массив для фигуры: округлённый список или typed array plotly.js."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'b':
+        values = values.astype(np.uint8)
+    if values.dtype.kind == 'f' and FLOAT_DIGITS >= 0:
+        values = np.round(values, FLOAT_DIGITS)
+    if not TYPED_ARRAYS or values.dtype.kind not in 'iuf' or values.size < TYPED_ARRAY_MIN_SIZE:
+        if values.dtype.kind == 'f':
+            return np.where(np.isnan(values), None, values).tolist()
+        return values.tolist()
+
+    dtype = _int_dtype(values) if values.dtype.kind in 'iu' else 'f4'
+    spec = {'dtype': dtype, 'bdata': base64.b64encode(values.astype(dtype).tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ','.join(str(n) for n in values.shape)
+    return spec
+
+
+def round_value(value):
+    if FLOAT_DIGITS < 0 or value is None or np.isnan(value):
+        return value
+    return round(float(value), FLOAT_DIGITS)
+
+
+class OutputSizes:
+    # Размер каждого выхода (id.свойство) в JSON и размер ответа до и после сжатия
+    def __init__(self):
+        self._outputs = {}
+        self._responses = {'raw': 0, 'sent': 0, 'count': 0}
+        self._lock = threading.Lock()
+        self._requests = itertools.count()
+
+    def sampled(self):
+        return OUTPUT_SIZES_SAMPLE > 0 and next(self._requests) % OUTPUT_SIZES_SAMPLE == 0
+
+    def observe_outputs(self, outputs, result):
+        """outputs - callback_context.outputs_list, result - то, что вернул callback."""
+        if isinstance(outputs, dict):
+            outputs, result = [outputs], [result]
+        sizes = {}
+        for output, value in zip(outputs, result):
+            if isinstance(output, list) or isinstance(value, type(dash.no_update)):
+                # Выходы с шаблонными id (ALL) и неизменённые выходы не замеряются
+                continue
+            component_id = output['id'] if isinstance(output['id'], str) else json.dumps(output['id'], sort_keys=True)
+            sizes[f"{component_id}.{output['property']}"] = len(
+                json.dumps(value, cls=PlotlyJSONEncoder, separators=(',', ':')))
+        with self._lock:
+            for output, size in sizes.items():
+                stats = self._outputs.setdefault(output, {'count': 0, 'bytes': 0, 'last': 0, 'max': 0})
+                stats['count'] += 1
+                stats['bytes'] += size
+                stats['last'] = size
+                stats['max'] = max(stats['max'], size)
+
+    def observe_response(self, raw_bytes, sent_bytes):
+        with self._lock:
+            self._responses['raw'] += raw_bytes
+            self._responses['sent'] += sent_bytes
+            self._responses['count'] += 1
+
+    def report(self):
+        with self._lock:
+            outputs = {output: dict(stats, mean=stats['bytes'] / stats['count'])
+                       for output, stats in sorted(self._outputs.items())}
+            return {'outputs': outputs, 'responses': dict(self._responses),
+                    'settings': {'compress': COMPRESS, 'typed_arrays': TYPED_ARRAYS, 'float_digits': FLOAT_DIGITS,
+                                 'output_sizes_sample': OUTPUT_SIZES_SAMPLE}}
+
+    def render(self):
+        report = self.report()
+        lines = [
+            '# HELP dash_output_bytes JSON size of Dash callback outputs.',
+            '# TYPE dash_output_bytes summary',
+        ]
+        for output, stats in report['outputs'].items():
+            lines.append(f'dash_output_bytes_sum{{output="{output}"}} {stats["bytes"]}')
+            lines.append(f'dash_output_bytes_count{{output="{output}"}} {stats["count"]}')
+        lines.append('# HELP dash_response_bytes_total Dash update responses before and after compression.')
+        lines.append('# TYPE dash_response_bytes_total counter')
+        lines.append(f'dash_response_bytes_total{{stage="raw"}} {report["responses"]["raw"]}')
+        lines.append(f'dash_response_bytes_total{{stage="sent"}} {report["responses"]["sent"]}')
+        return lines
+
+
+output_sizes = OutputSizes()
+
+
+def _gzip_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+
+def init_app(server):
+    # after_request выполняются в порядке, обратном регистрации:
+    # замер выходов -> сжатие (flask-compress) -> запасной gzip и замер отправленного размера
+    use_flask_compress = COMPRESS and Compress is not None
+
+    @server.after_request
+    def compress_and_measure_sent(response):
+        if COMPRESS and not use_flask_compress:
+            response = _gzip_response(response)
+        raw_bytes = g.pop('output_raw_bytes', None)
+        if raw_bytes is not None:
+            output_sizes.observe_response(raw_bytes, len(response.get_data()))
+        return response
+
+    if use_flask_compress:
+        server.config.setdefault('COMPRESS_MIMETYPES', sorted(COMPRESS_MIMETYPES))
+        server.config.setdefault('COMPRESS_MIN_SIZE', COMPRESS_MIN_BYTES)
+        Compress(server)
+
+    @server.after_request
+    def measure_response(response):
+        if request.path != metrics.UPDATE_PATH or response.status_code != 200 or response.is_streamed:
+            return response
+        # Тело ответа уже собрано: его длина ничего не стоит, разбирать JSON обратно не нужно
+        g.output_raw_bytes = len(response.get_data())
+        return response
+
+    def observe_result(result):
+        if output_sizes.sampled():
+            output_sizes.observe_outputs(dash.callback_context.outputs_list, result)
+
+    if OUTPUT_SIZES_SAMPLE > 0:
+        metrics.output_observer = observe_result
+
+    metrics.collectors.append(output_sizes.render)
+
+    @server.route('/output-sizes')
+    def output_sizes_report():
+        return jsonify(output_sizes.report())
@@ -0,0 +1,80 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Запуск дашборда в продакшене: gunicorn с несколькими воркерами (pre-fork).
+# Приложение импортируется в мастере до fork (preload_app), числовые столбцы и коды категорий
+# лежат в .npy-файлах и отображаются в память каждым воркером, поэтому добавление воркеров
+# не умножает память на их число. Строковые столбцы делятся между воркерами copy-on-write.
+# Каждый воркер держит свою версию данных: /admin/reload перезагружает воркер, принявший запрос,
+# и оставляет общую метку, по которой следящие потоки остальных воркеров перезагружаются следом
+# (раз в DASHBOARD_RELOAD_INTERVAL, а если он не задан - DASHBOARD_PREFORK_RELOAD_INTERVAL).
+
+BIND = os.environ.get('DASHBOARD_BIND', '0.0.0.0:8050')
+WORKERS = int(os.environ.get('DASHBOARD_WORKERS', str(os.cpu_count() or 1)))
+THREADS = int(os.environ.get('DASHBOARD_THREADS', '4'))
+TIMEOUT = int(os.environ.get('DASHBOARD_TIMEOUT', '120'))
+# После запуска прогреть кэш фигур частыми выборками (нужен FIGURE_CACHE_DB)
+WARMUP = os.environ.get('DASHBOARD_WARMUP') == '1'
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+def post_fork(server, worker):
+    import reloader
+    reloader.start_watcher(reloader.RELOAD_INTERVAL if reloader.RELOAD_INTERVAL > 0
+                           else reloader.PREFORK_RELOAD_INTERVAL)
+
+
+def when_ready(server):
+    # Прогрев идёт отдельным процессом, воркеры тем временем уже принимают запросы
+    if WARMUP:
+        subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warmup.py')])
+
+
+def make_application(options):
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import server
+            return server
+
+    return DashboardApplication()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск дашборда под gunicorn с несколькими воркерами')
+    parser.add_argument('--bind', default=BIND)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--threads', type=int, default=THREADS)
+    parser.add_argument('--timeout', type=int, default=TIMEOUT)
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        sys.exit("gunicorn не установлен: pip install -r requirements.txt (для разработки - python app.py)")
+
+    # Настройки читаются модулями при импорте, поэтому задаём их до загрузки приложения
+    os.environ.setdefault('DASHBOARD_SHARED_ARRAYS', '1')
+    os.environ.setdefault('DASHBOARD_STARTUP', 'preload')
+    os.environ['DASHBOARD_PREFORK'] = '1'
+
+    make_application({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'timeout': args.timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'when_ready': when_ready,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
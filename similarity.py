@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+# Похожие треки по аудио-характеристикам.
+# Характеристики каждого трека стандартизуются и лежат в одной непрерывной матрице float32.
+# Расстояния до выбранного трека считаются умножением матрицы на вектор блоками,
+# из каждого блока берутся k лучших, поэтому память запроса не зависит от числа треков.
+
+FEATURE_COLUMNS = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness',
+                   'instrumentalness', 'liveness', 'valence', 'tempo']
+BATCH_ROWS = 1 << 20
+
+
+class TrackSimilarity:
+    def __init__(self, df):
+        # df - каноническая таблица треков: код трека совпадает с номером его строки
+        self.track_ids = pd.Index(df['track_id'])
+
+        features = df[FEATURE_COLUMNS].to_numpy(dtype=np.float32)
+        self.mean = np.nanmean(features, axis=0)
+        self.std = np.nanstd(features, axis=0)
+        self.std[self.std == 0] = 1
+        matrix = np.nan_to_num((features - self.mean) / self.std)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def neighbours(self, track_id, k=10, candidates=None):
+        """(коды треков, расстояния) k ближайших к треку; candidates - допустимые коды треков."""
+        code = self.track_ids.get_indexer([track_id])[0]
+        n = len(self.matrix) if candidates is None else len(candidates)
+        if code < 0 or n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        vector = self.matrix[code]
+
+        best_codes, best_distances = [], []
+        for start in range(0, n, BATCH_ROWS):
+            if candidates is None:
+                block_codes = np.arange(start, min(start + BATCH_ROWS, n))
+                block = self.matrix[start:start + BATCH_ROWS]
+            else:
+                block_codes = candidates[start:start + BATCH_ROWS]
+                block = self.matrix[block_codes]
+            # |a - b|^2 = |a|^2 - 2ab + |b|^2, основная работа - одно умножение матрицы на вектор
+            distances = self.norms[block_codes] - 2 * (block @ vector) + self.norms[code]
+            distances[block_codes == code] = np.inf
+            if len(distances) > k:
+                top = np.argpartition(distances, k)[:k]
+                block_codes, distances = block_codes[top], distances[top]
+            best_codes.append(block_codes)
+            best_distances.append(distances)
+
+        codes = np.concatenate(best_codes)
+        distances = np.concatenate(best_distances)
+        order = np.argsort(distances, kind='stable')[:k]
+        codes, distances = codes[order], distances[order]
+        keep = np.isfinite(distances)
+        return codes[keep], np.sqrt(np.maximum(distances[keep], 0))
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# Приближённый подсчёт уникальных исполнителей через HyperLogLog.
+# Для каждой пары (страна, жанр) хранится массив из 2^precision регистров uint8.
+# Скетчи любых групп объединяются поэлементным максимумом, поэтому число исполнителей
+# для выборки стран и жанров считается по регистрам, без прохода по строкам таблицы.
+
+DEFAULT_PRECISION = 12
+
+
+def _hash_ranks(values, precision):
+    # Хэшируем только уникальные значения категории, строкам достаются готовые хэши по кодам
+    values = values.astype('category')
+    hashes = pd.util.hash_array(np.asarray(values.cat.categories.astype(str), dtype=object))
+    hashes = hashes[values.cat.codes.to_numpy()]
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    # Ранг - позиция первой единицы в следующих 32 битах; в float64 такие числа представимы точно
+    rest = ((hashes << np.uint64(precision)) >> np.uint64(32)).astype(np.float64)
+    with np.errstate(divide='ignore'):
+        rank = np.where(rest > 0, 32 - np.floor(np.log2(rest)), 33).astype(np.uint8)
+    return index, rank
+
+
+def estimate(registers):
+    """Оценка числа уникальных значений по регистрам (по строке на скетч)."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    # На малых количествах точнее линейный счёт по пустым регистрам
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+class GroupSketches:
+    def __init__(self, keys, registers, precision):
+        # keys: MultiIndex (country, track_genre); registers: по строке на группу
+        self.keys = keys
+        self.registers = registers
+        self.precision = precision
+
+    @property
+    def relative_error(self):
+        # Стандартная относительная ошибка HyperLogLog: это одно σ (типичное отклонение), а не граница
+        return 1.04 / np.sqrt(1 << self.precision)
+
+    @classmethod
+    def build(cls, df, precision=DEFAULT_PRECISION):
+        m = 1 << precision
+        group_codes, keys = pd.MultiIndex.from_arrays(
+            [df['country'].astype(str), df['track_genre'].astype(str)],
+            names=['country', 'track_genre']).factorize()
+        index, rank = _hash_ranks(df['artists'], precision)
+        cells = pd.Series(rank).groupby(group_codes.astype(np.int64) * m + index).max()
+        registers = np.zeros((len(keys), m), dtype=np.uint8)
+        registers.reshape(-1)[cells.index.to_numpy()] = cells.to_numpy()
+        return cls(pd.MultiIndex.from_tuples(keys, names=['country', 'track_genre']), registers, precision)
+
+    def merge(self, other):
+        keys = self.keys.union(other.keys)
+        registers = np.zeros((len(keys), self.registers.shape[1]), dtype=np.uint8)
+        for sketches in (self, other):
+            positions = keys.get_indexer(sketches.keys)
+            registers[positions] = np.maximum(registers[positions], sketches.registers)
+        return GroupSketches(keys, registers, self.precision)
+
+    def by_country(self, selected_countries=None, selected_genres=None):
+        """Таблица country, artist_count, error: оценка по объединённым скетчам выбранных жанров, error = 1σ."""
+        countries = self.keys.get_level_values('country')
+        genres = self.keys.get_level_values('track_genre')
+        mask = np.ones(len(self.keys), dtype=bool)
+        if selected_countries:
+            mask &= countries.isin(selected_countries)
+        if selected_genres:
+            mask &= genres.isin(selected_genres)
+
+        codes, names = pd.factorize(countries[mask])
+        if len(names):
+            # Группы одной страны идут подряд после сортировки, их регистры сворачиваются максимумом
+            order = np.argsort(codes, kind='stable')
+            starts = np.searchsorted(codes[order], np.arange(len(names)))
+            merged = np.maximum.reduceat(self.registers[mask][order], starts, axis=0)
+            counts = np.rint(estimate(merged)).astype(np.int64)
+        else:
+            counts = np.empty(0, dtype=np.int64)
+        return pd.DataFrame({
+            'country': np.asarray(names, dtype=object),
+            'artist_count': counts,
+            'error': np.ceil(counts * self.relative_error).astype(np.int64),
+        }).sort_values('country', ignore_index=True)
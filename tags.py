@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Теги Last.fm хранятся в таблице одной строкой через ';'. Здесь они раскладываются
+# в словарь тегов и таблицу связей строка -> код тега (int32), а поверх неё строится
+# инвертированный индекс тег -> отсортированные номера строк. Фильтр по набору тегов -
+# пересечение коротких отсортированных массивов, без поиска по строкам.
+
+TAG_SEPARATOR = ';'
+
+
+def split_tags(value):
+    # Порядок сохраняем, повторы и пустые теги выкидываем
+    tags = (tag.strip() for tag in str(value).split(TAG_SEPARATOR))
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+
+def _explode(values, dictionary, start_row=0):
+    # Строку разбираем один раз на категорию, а не на каждую строку таблицы
+    values = values.astype('category')
+    codes = values.cat.codes.to_numpy()
+    category_tags = [split_tags(category) for category in values.cat.categories]
+    for tags in category_tags:
+        for tag in tags:
+            dictionary.setdefault(tag, len(dictionary))
+
+    lengths = np.array([len(tags) for tags in category_tags] + [0], dtype=np.int64)
+    flat = np.array([dictionary[tag] for tags in category_tags for tag in tags], dtype=np.int32)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    # Код -1 (пропуск) указывает на последний элемент lengths, в котором 0 тегов
+    counts = lengths[codes]
+    row_ids = np.repeat(np.arange(start_row, start_row + len(codes), dtype=np.int32), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tag_ids = flat[np.repeat(starts[codes], counts) + offsets]
+    return row_ids, tag_ids
+
+
+class TagIndex:
+    def __init__(self, tags, row_ids, tag_ids, n_rows):
+        # Словарь: код -> тег
+        self.tags = tags
+        self.codes = {tag: code for code, tag in enumerate(tags)}
+        # Таблица связей строка -> тег
+        self.row_ids = row_ids
+        self.tag_ids = tag_ids
+        self.n_rows = n_rows
+        # Инвертированный индекс в формате CSR: строки тега code - postings[bounds[code]:bounds[code + 1]]
+        order = np.argsort(tag_ids, kind='stable')
+        self.postings = row_ids[order]
+        self.bounds = np.concatenate([[0], np.cumsum(np.bincount(tag_ids, minlength=len(tags)))])
+
+    @classmethod
+    def build(cls, values):
+        dictionary = {}
+        row_ids, tag_ids = _explode(values, dictionary)
+        return cls(list(dictionary), row_ids, tag_ids, len(values))
+
+    def append(self, new_values):
+        # Дописанные строки получают номера после существующих, старые связи не пересчитываются
+        dictionary = dict(self.codes)
+        row_ids, tag_ids = _explode(new_values, dictionary, start_row=self.n_rows)
+        return TagIndex(list(dictionary), np.concatenate([self.row_ids, row_ids]),
+                        np.concatenate([self.tag_ids, tag_ids]), self.n_rows + len(new_values))
+
+    def rows_for(self, tag):
+        code = self.codes.get(tag)
+        if code is None:
+            return self.postings[:0]
+        return self.postings[self.bounds[code]:self.bounds[code + 1]]
+
+    def filter(self, selected_tags):
+        """Номера строк, у которых есть все выбранные теги (None - фильтра нет)."""
+        if not selected_tags:
+            return None
+        # Начинаем с самого короткого списка, чтобы промежуточные пересечения были маленькими
+        postings = sorted((self.rows_for(tag) for tag in set(selected_tags)), key=len)
+        rows = postings[0]
+        for other in postings[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def counts(self):
+        return pd.Series(np.diff(self.bounds), index=self.tags, name='tracks').sort_values(ascending=False)
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Топ исполнителей и треков по странам для страницы 2.
+# Для каждой страны хранится свой частичный топ-K; топ для любой выборки
+# получается слиянием нескольких коротких списков, без сортировки всей таблицы.
+# Страна - атрибут исполнителя (приходит из таблицы исполнителей в data.py),
+# поэтому суммы по исполнителю внутри страны полные и слияние точное.
+
+TOP_K = 5
+TRACK_COLUMNS = ['track_name', 'artists', 'popularity']
+# Всё, что нужно для построения топов; остальные столбцы таблицы не копируются
+TOPK_COLUMNS = ['country'] + TRACK_COLUMNS
+
+
+def _pair_hashes(df):
+    return np.unique(pd.util.hash_pandas_object(
+        df[['country', 'artists', 'track_name']].astype(str), index=False).to_numpy())
+
+
+def select_rows(df, rows):
+    """Столбцы TOPK_COLUMNS выбранных строк таблицы треков."""
+    return pd.DataFrame({column: df[column].take(rows) for column in TOPK_COLUMNS})
+
+
+def _top_unique_tracks(rows, k):
+    # Строки - канонические треки, поэтому повторы названий редки (переиздания, одноимённые песни):
+    # сортируем только лучших кандидатов, а всю выборку - лишь если среди них меньше k разных названий
+    candidates = rows
+    if len(rows) > 2 * k:
+        # Маска сохраняет исходный порядок строк, поэтому равные по популярности идут как при полной сортировке
+        candidates = rows[rows['popularity'] >= rows['popularity'].nlargest(2 * k).iloc[-1]]
+    top = candidates.sort_values('popularity', ascending=False, kind='stable').drop_duplicates('track_name')
+    if len(top) < k and len(candidates) < len(rows):
+        top = rows.sort_values('popularity', ascending=False, kind='stable').drop_duplicates('track_name')
+    return top.head(k)
+
+
+class CountryTopK:
+    def __init__(self, artist_stats, pair_hashes, top_artists, top_tracks, k=TOP_K):
+        # artist_stats: (country, artists) -> total_popularity, track_count
+        self.artist_stats = artist_stats
+        # Хэши уже встреченных пар (страна, исполнитель, трек) для подсчёта уникальных треков;
+        # None - топы только для запросов, без дописывания
+        self.pair_hashes = pair_hashes
+        self.top_artists = top_artists
+        self.top_tracks = top_tracks
+        self.k = k
+
+    @classmethod
+    def build(cls, df, k=TOP_K, appendable=True):
+        # appendable=False - разовый топ по отфильтрованным строкам: хэши пар нужны только для append
+        artist_stats = df.groupby(['country', 'artists'], observed=True).agg(
+            total_popularity=('popularity', 'sum'),
+            track_count=('track_name', 'nunique')
+        )
+        artist_stats.index = artist_stats.index.set_levels(
+            [level.astype(str) for level in artist_stats.index.levels])
+        top_artists = {
+            country: group.droplevel('country').nlargest(k, 'total_popularity')
+            for country, group in artist_stats.groupby(level='country', observed=True)
+        }
+        top_tracks = {
+            country: _top_unique_tracks(group[TRACK_COLUMNS], k)
+            for country, group in df.groupby('country', observed=True)
+        }
+        return cls(artist_stats, _pair_hashes(df) if appendable else None, top_artists, top_tracks, k)
+
+    def copy(self):
+        return CountryTopK(self.artist_stats, self.pair_hashes, dict(self.top_artists),
+                           dict(self.top_tracks), self.k)
+
+    def append(self, new_rows):
+        # Новые треки только увеличивают суммы исполнителей, поэтому новый топ страны -
+        # это лучшие из старого топа и затронутых исполнителей
+        if self.pair_hashes is None:
+            raise ValueError('CountryTopK built with appendable=False cannot be appended to')
+        hashes = pd.util.hash_pandas_object(
+            new_rows[['country', 'artists', 'track_name']].astype(str), index=False).to_numpy()
+        first_seen = ~np.isin(hashes, self.pair_hashes) & ~pd.Series(hashes).duplicated().to_numpy()
+        self.pair_hashes = np.union1d(self.pair_hashes, hashes)
+
+        delta = pd.DataFrame({
+            'country': new_rows['country'].astype(str).to_numpy(),
+            'artists': new_rows['artists'].astype(str).to_numpy(),
+            'total_popularity': new_rows['popularity'].to_numpy(dtype='int64'),
+            'track_count': first_seen.astype('int64'),
+        }).groupby(['country', 'artists']).sum()
+
+        stats = self.artist_stats.add(delta, fill_value=0).astype('int64')
+        self.artist_stats = stats
+
+        for country, changed in delta.groupby(level='country'):
+            updated = stats.loc[country].loc[changed.index.get_level_values('artists')]
+            candidates = pd.concat([self.top_artists.get(country, updated.iloc[:0]), updated])
+            candidates = candidates[~candidates.index.duplicated(keep='last')]
+            self.top_artists[country] = candidates.nlargest(self.k, 'total_popularity')
+
+        for country, rows in new_rows.groupby(new_rows['country'].astype(str)):
+            candidates = pd.concat([self.top_tracks.get(country, rows[TRACK_COLUMNS].iloc[:0]), rows[TRACK_COLUMNS]])
+            self.top_tracks[country] = _top_unique_tracks(candidates, self.k)
+
+    def _countries(self, selected_countries, parts):
+        if not selected_countries:
+            return list(parts)
+        return [country for country in selected_countries if country in parts]
+
+    def query_artists(self, selected_countries, n=TOP_K):
+        parts = [self.top_artists[c] for c in self._countries(selected_countries, self.top_artists)]
+        if not parts:
+            return pd.DataFrame(columns=['artists', 'total_popularity', 'track_count', 'rank'])
+        top_artists = pd.concat(parts).nlargest(n, 'total_popularity').rename_axis('artists').reset_index()
+        top_artists['rank'] = range(1, len(top_artists) + 1)
+        return top_artists
+
+    def query_tracks(self, selected_countries, n=TOP_K):
+        parts = [self.top_tracks[c] for c in self._countries(selected_countries, self.top_tracks)]
+        if not parts:
+            return pd.DataFrame(columns=TRACK_COLUMNS + ['rank'])
+        top_tracks = _top_unique_tracks(pd.concat(parts), n).reset_index(drop=True)
+        top_tracks['rank'] = range(1, len(top_tracks) + 1)
+        return top_tracks
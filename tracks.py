@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+# Нормализованная таблица треков.
+# В исходном CSV трек повторяется строкой на каждый жанр (track_genre) с теми же характеристиками.
+# Загрузчик раскладывает её на каноническую таблицу (строка на track_id: характеристики,
+# популярность, длительность, исполнитель) и компактную таблицу связей трек -> жанр
+# (номер строки CSV, код трека int32, жанр). Одна связь каждого трека помечена как основная:
+# потрековые суммы считаются только по ней, поэтому трек из нескольких жанров не учитывается дважды.
+
+LINK_COLUMNS = ['id', 'track_genre']
+
+
+def split_tracks(df):
+    """(канонические треки, связи трек -> жанр) из таблицы со строкой на пару трек-жанр."""
+    codes, _ = pd.factorize(df['track_id'])
+    primary = ~pd.Series(codes).duplicated().to_numpy()
+    tracks = df.drop(columns=LINK_COLUMNS)[primary].reset_index(drop=True)
+    # Популярность копий одного трека может немного отличаться (сняты в разное время), берём максимум
+    tracks['popularity'] = df['popularity'].groupby(codes).max().to_numpy().astype(df['popularity'].dtype)
+    links = pd.DataFrame({
+        'id': df['id'].to_numpy(),
+        'track': codes.astype(np.int32),
+        'track_genre': df['track_genre'].reset_index(drop=True),
+        'primary': primary,
+    })
+    return tracks, links
+
+
+def append_tracks(tracks, links, new_rows, concat):
+    """(треки, связи, новые связи) после дописывания строк CSV; concat склеивает две таблицы.
+
+    Строки уже известных треков добавляют только связи, характеристики трека не меняются.
+    """
+    new_tracks, new_links = split_tracks(new_rows)
+    known = pd.Index(tracks['track_id']).get_indexer(new_tracks['track_id'])
+    is_new = known < 0
+    # Новые треки получают коды после существующих в порядке первого появления
+    mapping = np.where(is_new, len(tracks) + np.cumsum(is_new) - 1, known).astype(np.int32)
+    local = new_links['track'].to_numpy()
+    new_links['track'] = mapping[local]
+    new_links['primary'] &= is_new[local]
+    return (concat(tracks, new_tracks[is_new].reset_index(drop=True)),
+            concat(links, new_links), new_links)
+
+
+def link_frame(tracks, links, columns=None):
+    """Связи вместе со столбцами их треков: строка на пару трек-жанр, как в исходном CSV.
+
+    Столбцы: id, столбцы трека (все или columns), track_genre, primary.
+    """
+    positions = links['track'].to_numpy()
+    frame = {'id': links['id'].to_numpy()}
+    for column in tracks.columns if columns is None else columns:
+        frame[column] = tracks[column].take(positions).reset_index(drop=True)
+    frame['track_genre'] = links['track_genre'].reset_index(drop=True)
+    frame['primary'] = links['primary'].to_numpy()
+    return pd.DataFrame(frame)
+
+
+def links_of(links, track_rows, n_tracks, genres=None):
+    """Связи выбранных треков (None - всех), только выбранных жанров; основная связь - первая в выборке."""
+    if track_rows is None and not genres:
+        return links
+    keep = np.ones(len(links), dtype=bool)
+    if track_rows is not None:
+        mask = np.zeros(n_tracks, dtype=bool)
+        mask[track_rows] = True
+        keep = mask[links['track'].to_numpy()]
+    if genres:
+        keep &= links['track_genre'].isin(genres).to_numpy()
+    subset = links[keep]
+    return subset.assign(primary=~subset['track'].duplicated().to_numpy())
+
+
+class RowGroups:
+    """Номера строк по группам (CSR): строки группы g - rows[offsets[g]:offsets[g + 1]] по возрастанию.
+
+    codes - номер группы каждой строки (отрицательный - строка ни в какую группу не входит).
+    """
+
+    def __init__(self, codes, n_groups):
+        codes = np.asarray(codes)
+        valid = np.flatnonzero(codes >= 0)
+        self.rows = valid[np.argsort(codes[valid], kind='stable')].astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes[valid], minlength=n_groups))])
+
+    def of(self, group):
+        return self.rows[self.offsets[group]:self.offsets[group + 1]]
@@ -0,0 +1,151 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Прогрев кэша фигур после развёртывания или перезагрузки данных.
+# Результаты callback'ов для пустой выборки, каждой страны и частых наборов стран считаются
+# параллельно в пуле процессов и записываются в SQLite-кэш фигур (FIGURE_CACHE_DB),
+# откуда их читают воркеры сервера. Частые наборы стран берутся из JSON-файла
+# и из статистики запросов того же кэша. Фильтры в ключах кэша приводятся к действующим
+# (figure_cache.selection_key), поэтому вызов без фильтров совпадает с запросом браузера,
+# где все фильтры сброшены.
+
+WARMUP_CALLBACKS = [
+    ('pages.page1', 'update_all_charts'),
+    ('pages.page1', 'update_quantiles'),
+    ('pages.page2', 'update_map'),
+    ('pages.page2', 'update_top_lists'),
+]
+TOP_SELECTIONS = int(os.environ.get('DASHBOARD_WARMUP_TOP', '50'))
+
+_callbacks = None
+
+
+def _init_worker():
+    global _callbacks
+    import app  # noqa: F401  регистрирует страницы
+    from figure_cache import figure_cache
+    figure_cache.record_requests = False
+    _callbacks = [(name, getattr(importlib.import_module(module), name)) for module, name in WARMUP_CALLBACKS]
+
+
+def warm_selection(selection):
+    # Аргументы те же, что присылает браузер без фильтров, поэтому совпадают и ключи кэша
+    timings = {}
+    for name, func in _callbacks:
+        start = time.perf_counter()
+        func(selection, None)
+        timings[name] = time.perf_counter() - start
+    return selection, timings
+
+
+def _namespaces():
+    return {getattr(importlib.import_module(module), name).cache_namespace for module, name in WARMUP_CALLBACKS}
+
+
+def frequent_selections(limit):
+    """Самые частые наборы из нескольких стран без других фильтров по статистике кэша фигур."""
+    from figure_cache import figure_cache
+    namespaces = _namespaces()
+    counts = Counter()
+    for key, hits in figure_cache.frequent(limit * 10):
+        namespace, *selections = json.loads(key)
+        # Ключ в каноническом виде: [пространство имён, страны, действующие фильтры]; сброшенные фильтры - []
+        if (namespace in namespaces and len(selections) == 2
+                and len(selections[0]) > 1 and not selections[1]):
+            counts[tuple(selections[0])] += hits
+    return [list(countries) for countries, _ in counts.most_common(limit)]
+
+
+def browser_hits(data):
+    """Попадает ли в кэш запрос браузера для пустой выборки со сброшенными фильтрами (по callback'ам)."""
+    from figure_cache import figure_cache, selection_key
+    low, high = data.get('filter_index').value_range('popularity')
+    # Так Store filter-selection заполняет клиентский callback страницы 1
+    filters = {'tags': [], 'track_genre': [], 'explicit': [], 'mode': [], 'key': [], 'time_signature': [],
+               'popularity': [low, high]}
+    hits = {}
+    for module, name in WARMUP_CALLBACKS:
+        namespace = getattr(importlib.import_module(module), name).cache_namespace
+        hits[name] = figure_cache.contains(selection_key(data, namespace, ([], filters)), data.version)
+    return hits
+
+
+def collect_selections(data, path=None, top=TOP_SELECTIONS):
+    from figure_cache import normalize_selection
+    selections = [[]] + [[country] for country in sorted(map(str, data.df['country'].unique()))]
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            selections += json.load(f)
+    selections += frequent_selections(top)
+
+    unique = {}
+    for selection in selections:
+        unique.setdefault(normalize_selection(selection), list(selection))
+    return list(unique.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Прогрев кэша фигур для частых выборок')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--selections', default=None, help='JSON-файл со списком наборов стран')
+    parser.add_argument('--top', type=int, default=TOP_SELECTIONS,
+                        help='сколько частых наборов взять из статистики запросов')
+    parser.add_argument('--output', default=None, help='JSON-файл с отчётом')
+    args = parser.parse_args()
+
+    if not os.environ.get('FIGURE_CACHE_DB'):
+        sys.exit("FIGURE_CACHE_DB не задан: прогретые результаты негде сохранить для воркеров сервера")
+
+    # Данные и производные готовятся один раз здесь, процессы пула получают их через fork
+    os.environ['DASHBOARD_STARTUP'] = 'lazy'
+    os.environ['DASHBOARD_RELOAD_INTERVAL'] = '0'
+    start = time.perf_counter()
+    import app  # noqa: F401
+    import dataset
+    data = dataset.preload()
+    load_seconds = time.perf_counter() - start
+
+    selections = collect_selections(data, args.selections, args.top)
+    print(f"Данные готовы за {load_seconds:.2f} с, выборок: {len(selections)}, процессов: {args.workers}",
+          file=sys.stderr)
+
+    start = time.perf_counter()
+    callbacks = {name: {'total': 0.0, 'max': 0.0} for _, name in WARMUP_CALLBACKS}
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(warm_selection, selection) for selection in selections]
+        for done, future in enumerate(as_completed(futures), 1):
+            selection, timings = future.result()
+            for name, seconds in timings.items():
+                callbacks[name]['total'] += seconds
+                callbacks[name]['max'] = max(callbacks[name]['max'], seconds)
+            print(f"[{done}/{len(selections)}] {', '.join(selection) or 'все страны'}: "
+                  f"{sum(timings.values()):.3f} с", file=sys.stderr)
+
+    hits = browser_hits(data)
+    if not all(hits.values()):
+        print(f"Запрос браузера не попадает в прогретый кэш: {hits}", file=sys.stderr)
+
+    report = {
+        'version': data.version,
+        'selections': len(selections),
+        'workers': args.workers,
+        'load_seconds': load_seconds,
+        'warmup_seconds': time.perf_counter() - start,
+        'callbacks': callbacks,
+        'browser_hits': hits,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()